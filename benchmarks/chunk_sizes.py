@@ -0,0 +1,59 @@
+'''
+Micro-benchmark for the chunk sizes used when hashing files and writing downloads.
+
+Prints the throughput in MB/s of `compute_file_hash` and of the hash-and-write loop
+used by `ScitranClient.download_file` for a range of chunk sizes.
+
+    python -m benchmarks.chunk_sizes [file size in MB]
+'''
+from __future__ import print_function
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from scitran_client.st_client import compute_file_hash
+
+CHUNK_SIZES = [4 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024]
+
+
+def _throughput(size, fn):
+    start = time.time()
+    fn()
+    return size / (1024.0 * 1024) / (time.time() - start)
+
+
+def _write_chunks(data, chunk_size, path):
+    '''Mimics download_file: writes and hashes data that arrives in chunks of chunk_size.'''
+    h = hashlib.new('sha384')
+    view = memoryview(data)
+    with open(path, 'wb') as fd:
+        for start in range(0, len(data), chunk_size):
+            chunk = view[start:start + chunk_size].tobytes()
+            fd.write(chunk)
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def main(size_mb=256):
+    size = size_mb * 1024 * 1024
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        data = os.urandom(size)
+        source = os.path.join(tmp_dir, 'source')
+        with open(source, 'wb') as f:
+            f.write(data)
+
+        print('{:>12} {:>14} {:>14}'.format('chunk size', 'hash MB/s', 'write MB/s'))
+        for chunk_size in CHUNK_SIZES:
+            hash_rate = _throughput(size, lambda: compute_file_hash(source, chunk_size=chunk_size))
+            write_rate = _throughput(size, lambda: _write_chunks(data, chunk_size, os.path.join(tmp_dir, 'dest')))
+            print('{:>12} {:>14.1f} {:>14.1f}'.format(chunk_size, hash_rate, write_rate))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
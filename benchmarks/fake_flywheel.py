@@ -0,0 +1,287 @@
+'''
+A local, in-process stand-in for the parts of the Flywheel API used by this client.
+
+It serves searches, projects, sessions, acquisitions, gears, file downloads (with Range
+support), tar archives of many files (bulk download tickets), analysis uploads and analysis
+jobs that go from pending to running to complete as their session is polled. All data is generated and kept in memory.
+
+> with FakeFlywheel(file_count=10) as server:
+>     client = ScitranClient(server.url, st_dir=server.write_auth(tmp_dir))
+'''
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from scitran_client.settings import HASH_PREFIX
+
+_RANGE_PATTERN = re.compile(r'^bytes=(\d+)-$')
+
+# Order in which the jobs of analyses advance, one step per poll of their session.
+JOB_STATES = ('pending', 'running', 'complete')
+
+
+def _object_id(kind, index):
+    '''Returns an ID that looks like the ObjectIds of Flywheel, unique for every `kind` and `index`.'''
+    return '{:08x}{:016x}'.format(kind, index)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops connections when many threads connect at once.
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # responses are written in one piece rather than line by line, so small responses are
+    # not held back by Nagle's algorithm waiting for a delayed ACK.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, value, status=200):
+        self._send(status, json.dumps(value).encode('utf-8'), {'Content-Type': 'application/json'})
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _route(self, routes):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query, keep_blank_values=True))
+        path = url.path[len('/api/'):] if url.path.startswith('/api/') else None
+        for pattern, name in routes:
+            match = path is not None and re.match(pattern + '$', path)
+            if match:
+                if self.server.flywheel.latency:
+                    time.sleep(self.server.flywheel.latency)
+                return getattr(self.server.flywheel, name)(self, params, *match.groups())
+        self._send_json(dict(message='not found'), status=404)
+
+    def do_GET(self):
+        self._route([
+            (r'users/self', 'get_user'),
+            (r'projects', 'get_projects'),
+            (r'projects/([^/]+)/sessions', 'get_project_sessions'),
+            (r'sessions/([^/]+)', 'get_session'),
+            (r'sessions/([^/]+)/acquisitions', 'get_session_acquisitions'),
+            (r'acquisitions/([^/]+)/files/(.+)', 'get_file'),
+            (r'gears', 'get_gears'),
+            (r'download', 'get_download'),
+        ])
+
+    def do_POST(self):
+        self._route([
+            (r'search', 'post_search'),
+            (r'download', 'post_download'),
+            (r'sessions/([^/]+)/analyses', 'post_analysis'),
+            (r'sessions/([^/]+)/analyses/([^/]+)/files', 'post_analysis_file'),
+        ])
+
+
+class FakeFlywheel(object):
+    '''A fake Flywheel server listening on a free port of 127.0.0.1.
+
+    Args:
+        session_count (int): Number of sessions in the single project.
+        file_count (int): Number of files, spread over one acquisition per session.
+        file_size (int): Size of every file in bytes.
+        search_hit_count (int): Number of hits returned by searches for anything but files.
+        latency (float): Seconds every request takes before it is answered, to stand in for the
+            network and the work of a real server.
+    '''
+
+    def __init__(self, session_count=10, file_count=10, file_size=1024 * 1024, search_hit_count=1000, latency=0):
+        self.latency = latency
+        self.project = dict(_id=_object_id(1, 0), label='Benchmark Project')
+        self.sessions = [
+            dict(_id=_object_id(2, i), label='session {}'.format(i), created='2017-01-01T00:00:{:02}'.format(i % 60))
+            for i in range(session_count)
+        ]
+        self.acquisitions = {
+            session['_id']: [dict(_id=_object_id(3, i), label='T1w', files=[])]
+            for i, session in enumerate(self.sessions)
+        }
+        self.gears = [dict(_id=_object_id(4, 0), gear=dict(name='fake-gear', config=dict(threshold=dict(default=.5))))]
+
+        self.files = {}
+        for i in range(file_count):
+            acquisition = self.acquisitions[self.sessions[i % session_count]['_id']][0]
+            name = 'file{}.nii.gz'.format(i)
+            # every file is different, so downloads can not be answered from a cache.
+            content = hashlib.sha512(name).digest() * (file_size // 64) + b'\0' * (file_size % 64)
+            self.files[(acquisition['_id'], name)] = content
+            acquisition['files'].append(dict(name=name, size=len(content)))
+
+        self.search_hit_count = search_hit_count
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._tickets = {}
+        self.reset()
+
+    def add_file(self, acquisition_id, name, content):
+        '''Serves `content` as the file `name` of the acquisition with ID `acquisition_id`, which does
+        not have to be one of the generated acquisitions.'''
+        self.files[(acquisition_id, name)] = content
+
+    def reset(self):
+        '''Removes all analyses and resets the count of uploaded bytes.'''
+        with self._lock:
+            self.analyses = {session['_id']: [] for session in self.sessions}
+            self.uploaded_bytes = 0
+
+    def file_search_results(self):
+        '''Returns file search hits for every file, like `client.search_files` would.'''
+        return [
+            dict(_id=name, _source=dict(
+                container_name='acquisitions',
+                acquisition=dict(_id=acquisition_id),
+                name=name,
+                hash=HASH_PREFIX + hashlib.sha384(content).hexdigest(),
+                size=len(content),
+            ))
+            for (acquisition_id, name), content in sorted(self.files.items())
+        ]
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.flywheel = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_port)
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def write_auth(self, st_dir):
+        '''Writes an auth.json for this server to `st_dir` and returns `st_dir`.'''
+        with open(os.path.join(st_dir, 'auth.json'), 'w') as f:
+            json.dump({'fake': dict(url=self.url, api_key='secret')}, f)
+        return st_dir
+
+    # Request handlers, called with the request handler, the query parameters and the URL groups.
+
+    def get_user(self, handler, params):
+        handler._send_json(dict(_id='user@example.com'))
+
+    def get_projects(self, handler, params):
+        handler._send_json([self.project])
+
+    def get_project_sessions(self, handler, params, project_id):
+        handler._send_json(self.sessions)
+
+    def get_session(self, handler, params, session_id):
+        session = next((s for s in self.sessions if s['_id'] == session_id), None)
+        if session is None:
+            return handler._send_json(dict(message='not found'), status=404)
+        with self._lock:
+            analyses = self.analyses[session_id]
+            for analysis in analyses:
+                job = analysis['job']
+                job['state'] = JOB_STATES[min(JOB_STATES.index(job['state']) + 1, len(JOB_STATES) - 1)]
+            handler._send_json(dict(session, analyses=analyses))
+
+    def get_session_acquisitions(self, handler, params, session_id):
+        handler._send_json(self.acquisitions.get(session_id, []))
+
+    def get_gears(self, handler, params):
+        handler._send_json(self.gears)
+
+    def get_file(self, handler, params, acquisition_id, name):
+        content = self.files.get((acquisition_id, name))
+        if content is None:
+            return handler._send_json(dict(message='not found'), status=404)
+        match = _RANGE_PATTERN.match(handler.headers.get('Range') or '')
+        if not match:
+            return handler._send(200, content)
+        start = int(match.group(1))
+        if start >= len(content):
+            return handler._send(416, headers={'Content-Range': 'bytes */{}'.format(len(content))})
+        handler._send(206, content[start:], {
+            'Content-Range': 'bytes {}-{}/{}'.format(start, len(content) - 1, len(content)),
+        })
+
+    def post_download(self, handler, params):
+        body = json.loads(handler._read_body())
+        ticket = _object_id(6, next(self._ids))
+        with self._lock:
+            self._tickets[ticket] = [
+                (ref['container_name'], ref['container_id'], ref['filename']) for ref in body['files']]
+        handler._send_json(dict(ticket=ticket, file_cnt=len(body['files'])))
+
+    def get_download(self, handler, params):
+        with self._lock:
+            refs = self._tickets.pop(params.get('ticket'), None)
+        if refs is None:
+            return handler._send_json(dict(message='invalid ticket'), status=400)
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as archive:
+            for container_name, container_id, filename in refs:
+                content = self.files.get((container_id, filename))
+                if content is not None:
+                    info = tarfile.TarInfo('{}/{}/{}'.format(container_name, container_id, filename))
+                    info.size = len(content)
+                    archive.addfile(info, io.BytesIO(content))
+        handler._send(200, buf.getvalue(), {'Content-Type': 'application/octet-stream'})
+
+    def post_search(self, handler, params):
+        body = json.loads(handler._read_body())
+        path = body['path'].split('/')[-1]
+        if path == 'files':
+            hits = self.file_search_results()
+        else:
+            hits = [
+                dict(_id='{}{}'.format(path, i), _source=dict(label='{} {}'.format(path, i), index=i))
+                for i in range(self.search_hit_count)
+            ]
+        for index, hit in enumerate(hits):
+            hit['sort'] = [index]
+        start = body['search_after'][0] + 1 if body.get('search_after') else body.get('from', 0)
+        size = body.get('size', int(params.get('size', -1)))
+        hits = hits[start:] if size < 0 else hits[start:start + size]
+        handler._send_json({path: hits})
+
+    def post_analysis(self, handler, params, session_id):
+        body = handler._read_body()
+        with self._lock:
+            self.uploaded_bytes += len(body)
+            analysis_id = _object_id(5, next(self._ids))
+            if params.get('job'):
+                analysis = json.loads(body)
+                analysis.update(_id=analysis_id, job=dict(analysis['job'], state=JOB_STATES[0]), files=[])
+            else:
+                analysis = dict(_id=analysis_id, label='upload', job=dict(state='complete'), files=[])
+            self.analyses.setdefault(session_id, []).append(analysis)
+        handler._send_json(dict(_id=analysis_id))
+
+    def post_analysis_file(self, handler, params, session_id, analysis_id):
+        body = handler._read_body()
+        with self._lock:
+            self.uploaded_bytes += len(body)
+        handler._send_json({})
@@ -0,0 +1,50 @@
+'''
+Measures how long `import scitran_client` takes in a fresh interpreter.
+
+Prints the best of `--repeat` runs and exits with status 1 when it is over `--budget` seconds,
+or when one of the modules that should only be imported on first use was imported.
+
+    python -m benchmarks.import_time [--repeat 10] [--budget 0.15]
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Slow to import and only needed by some features, so `import scitran_client` must not load them.
+LAZY_MODULES = ['docker', 'pandas', 'numpy', 'tqdm', 'concurrent.futures', 'scitran_client.flywheel_analyzer']
+
+_SCRIPT = '''
+import json, sys, time
+start = time.time()
+import scitran_client
+seconds = time.time() - start
+print(json.dumps(dict(seconds=seconds, modules=[m for m in {} if m in sys.modules])))
+'''.format(LAZY_MODULES)
+
+
+def measure_import():
+    '''Imports scitran_client in a new interpreter and returns the seconds it took and the lazy modules it loaded.'''
+    result = json.loads(subprocess.check_output([sys.executable, '-c', _SCRIPT]))
+    return result['seconds'], result['modules']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measures the time `import scitran_client` takes.')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget', type=float, default=.15, help='maximum import time in seconds')
+    args = parser.parse_args(argv)
+
+    runs = [measure_import() for _ in range(args.repeat)]
+    best = min(seconds for seconds, _ in runs)
+    loaded = sorted(set(module for _, modules in runs for module in modules))
+    print('import scitran_client: {:.1f} ms (budget {:.1f} ms)'.format(best * 1000, args.budget * 1000))
+    if loaded:
+        print('imported modules that should be lazy:', ', '.join(loaded))
+    return 1 if best > args.budget or loaded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+'''
+Benchmarks of the client against a local fake Flywheel server (see fake_flywheel.py).
+
+Runs every benchmark `--repeat` times and writes the timings, along with the number of
+requests each run needed and the throughput of transfers, to benchmarks/results/<commit>.json. Pass `--compare`
+with an earlier results file to see how the timings changed; the exit status is 1 when a
+benchmark became slower than `--threshold` allows.
+
+    python -m benchmarks.run [--repeat 5] [--only search,download_file] [--compare benchmarks/results/abc1234.json]
+'''
+from __future__ import print_function
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from scitran_client import ScitranClient, compute_file_hash
+import scitran_client.flywheel_analyzer as fa
+from benchmarks.fake_flywheel import FakeFlywheel
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+@contextmanager
+def _quiet():
+    '''Silences the progress bars and prints of the code being measured.
+
+    tqdm keeps a reference to the original sys.stderr, so the file descriptors are redirected.
+    '''
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, original in zip((1, 2), saved):
+            os.dup2(original, fd)
+            os.close(original)
+        os.close(devnull)
+
+
+def _fresh_dir(tmp_dir, name):
+    path = os.path.join(tmp_dir, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    return path
+
+
+def bench_search(client, server, tmp_dir):
+    return client.search(dict(path='acquisitions'), use_cache=False)
+
+
+def bench_iter_search(client, server, tmp_dir):
+    return list(client.iter_search(dict(path='acquisitions'), page_size=max(server.search_hit_count // 10, 1)))
+
+
+def bench_download_file(client, server, tmp_dir):
+    dest_dir = _fresh_dir(tmp_dir, 'download_file')
+    source = server.file_search_results()[0]['_source']
+    client.download_file(
+        'acquisitions', source['acquisition']['_id'], source['name'], source['hash'],
+        dest_dir=dest_dir, tqdm_disable=True)
+    return source['size']
+
+
+def bench_download_all(client, server, tmp_dir):
+    results = server.file_search_results()
+    client.download_all_file_search_results(results, dest_dir=_fresh_dir(tmp_dir, 'download_all'), max_workers=4)
+    return sum(result['_source']['size'] for result in results)
+
+
+def bench_download_archive(client, server, tmp_dir):
+    results = server.file_search_results()
+    client.download_archive(results, dest_dir=_fresh_dir(tmp_dir, 'download_archive'), tqdm_disable=True)
+    return sum(result['_source']['size'] for result in results)
+
+
+def bench_upload_analysis(client, server, tmp_dir):
+    in_dir, out_dir = _fresh_dir(tmp_dir, 'upload_in'), _fresh_dir(tmp_dir, 'upload_out')
+    content = server.files.values()[0]
+    for dir in (in_dir, out_dir):
+        with open(os.path.join(dir, 'data.bin'), 'wb') as f:
+            f.write(content)
+    client.upload_analysis(in_dir, out_dir, dict(label='benchmark'), server.sessions[0]['_id'], tqdm_disable=True)
+    return 2 * len(content)
+
+
+def bench_compute_file_hash(client, server, tmp_dir):
+    path = os.path.join(tmp_dir, 'hash_input')
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            for content in server.files.values():
+                f.write(content)
+    compute_file_hash(path)
+    return os.path.getsize(path)
+
+
+def bench_flywheel_analyzer(client, server, tmp_dir):
+    server.reset()
+    operation = fa.define_analysis(
+        'fake-gear', lambda acquisitions, **kwargs: dict(
+            image=fa.find(acquisitions, label='T1w').find_file('*.nii.gz', default=None)))
+    sleep = fa._sleep
+    # the fake server advances jobs on every poll, so there is nothing to wait for.
+    fa._sleep = lambda seconds: None
+    try:
+        with fa.installed_client(client):
+            fa.run([operation], project=fa.find_project(label=server.project['label']), max_workers=4)
+    finally:
+        fa._sleep = sleep
+
+
+BENCHMARKS = [
+    ('search', bench_search),
+    ('iter_search', bench_iter_search),
+    ('download_file', bench_download_file),
+    ('download_all', bench_download_all),
+    ('download_archive', bench_download_archive),
+    ('upload_analysis', bench_upload_analysis),
+    ('compute_file_hash', bench_compute_file_hash),
+    ('flywheel_analyzer', bench_flywheel_analyzer),
+]
+
+
+def _request_count(client):
+    return sum(stats['requests'] for stats in client.metrics.as_dict().values())
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+def run_benchmarks(names=None, repeat=5, server_kwargs=None):
+    '''Runs the benchmarks called `names` (all by default) and returns their results.'''
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        with FakeFlywheel(**(server_kwargs or {})) as server:
+            client = ScitranClient(
+                server.url, st_dir=server.write_auth(tmp_dir), downloads_dir=tmp_dir,
+                gear_in_dir=os.path.join(tmp_dir, 'input'), gear_out_dir=os.path.join(tmp_dir, 'output'),
+                hash_cache=None)
+            results = {}
+            for name, benchmark in BENCHMARKS:
+                if names and name not in names:
+                    continue
+                seconds = []
+                requests = _request_count(client)
+                for _ in range(repeat):
+                    start = time.time()
+                    with _quiet():
+                        size = benchmark(client, server, tmp_dir)
+                    seconds.append(time.time() - start)
+                result = dict(
+                    seconds=seconds,
+                    min=min(seconds),
+                    median=_median(seconds),
+                    requests=(_request_count(client) - requests) // repeat,
+                )
+                if isinstance(size, int):
+                    result['mb_per_s'] = size / (1024.0 * 1024) / result['median']
+                results[name] = result
+            return results
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(baseline, current, threshold):
+    '''Prints the change of every benchmark's median and returns the names of regressed benchmarks.'''
+    regressions = []
+    print('{:<20} {:>12} {:>12} {:>9}'.format('benchmark', 'baseline s', 'current s', 'change'))
+    for name, result in sorted(current['benchmarks'].items()):
+        if name not in baseline['benchmarks']:
+            continue
+        before = baseline['benchmarks'][name]['median']
+        change = result['median'] / before - 1 if before else 0
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print('{:<20} {:>12.4f} {:>12.4f} {:>+8.1%}{}'.format(
+            name, before, result['median'], change, ' !' if regressed else ''))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the client against a fake Flywheel server.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help='comma separated names of the benchmarks to run')
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/<commit>.json')
+    parser.add_argument('--compare', help='results file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=.1,
+                        help='relative slowdown of the median that counts as a regression')
+    args = parser.parse_args(argv)
+
+    commit = _commit()
+    current = dict(
+        commit=commit,
+        date=datetime.datetime.utcnow().isoformat(),
+        python=platform.python_version(),
+        benchmarks=run_benchmarks(args.only and args.only.split(','), repeat=args.repeat),
+    )
+
+    output = args.output or os.path.join(RESULTS_DIR, '{}.json'.format(commit))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2, sort_keys=True)
+    print('wrote', output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            return 1
+    else:
+        for name, result in sorted(current['benchmarks'].items()):
+            print('{:<20} {:>10.4f} s {:>5} requests'.format(name, result['median'], result['requests']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+'''
+Measures how request throughput of one shared ScitranClient scales with the number of threads.
+
+Every thread sends small GET requests through the same client to a local fake Flywheel server
+(see fake_flywheel.py) that takes `latency` milliseconds to answer, like a server across a
+network. Prints requests per second and the median and 99th percentile latency for every
+thread count, for per-thread sessions (the default) and for a single shared session.
+
+    python -m benchmarks.scaling [requests per thread count] [latency in ms]
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from scitran_client import ScitranClient
+from benchmarks.fake_flywheel import FakeFlywheel
+
+THREAD_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+
+
+def measure(server, tmp_dir, threads, requests, thread_safe=True):
+    '''Sends `requests` GET requests from `threads` threads and returns requests/s, p50 and p99 in seconds.'''
+    client = ScitranClient(
+        server.url, st_dir=tmp_dir, downloads_dir=tmp_dir,
+        gear_in_dir=os.path.join(tmp_dir, 'input'), gear_out_dir=os.path.join(tmp_dir, 'output'),
+        hash_cache=None, pool_maxsize=threads, single_flight=False, thread_safe=thread_safe)
+    sessions = [session['_id'] for session in server.sessions]
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(
+            lambda i: client.request('sessions/{}/acquisitions'.format(sessions[i % len(sessions)])),
+            range(requests)))
+    seconds = time.time() - start
+
+    stats = client.stats()['endpoints']['GET sessions/{id}/acquisitions']
+    assert stats['requests'] == requests and stats['errors'] == 0
+    return requests / seconds, stats['p50'], stats['p99']
+
+
+def main(requests=2000, latency_ms=20):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        with FakeFlywheel(latency=latency_ms / 1000.0) as server:
+            server.write_auth(tmp_dir)
+            print('{:>8} {:>22} {:>22}'.format('threads', 'per-thread sessions', 'shared session'))
+            print('{:>8} {:>10} {:>11} {:>10} {:>11}'.format('', 'req/s', 'p50/p99 ms', 'req/s', 'p50/p99 ms'))
+            for threads in THREAD_COUNTS:
+                row = [threads]
+                for thread_safe in (True, False):
+                    rate, p50, p99 = measure(server, tmp_dir, threads, requests, thread_safe)
+                    row += [rate, '{:.1f}/{:.1f}'.format(p50 * 1000, p99 * 1000)]
+                print('{:>8} {:>10.0f} {:>11} {:>10.0f} {:>11}'.format(*row))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -5,7 +5,16 @@
 """
 SDM interaction python module.
 """
-from st_client import ScitranClient, compute_file_hash
+from st_client import ScitranClient, compute_file_hash, FILE_DOWNLOAD_FIELDS
+from hash_cache import HashCache
+from blob_store import BlobStore
+from async_client import AsyncScitranClient
+from retry import RetryPolicy, CircuitBreaker
+from search_cache import SearchCache
+from http_cache import HTTPCache
+from metrics import RequestMetrics
+from single_flight import SingleFlight
+from rate_limit import RateLimiter, Limit
 from query_builder import (
     query,
     Files,
@@ -15,10 +24,12 @@ from query_builder import (
     Acquisitions,
     Groups,
 )
-import flywheel_analyzer
+# flywheel_analyzer is not imported here to keep `import scitran_client` fast. It is still
+# available as `import scitran_client.flywheel_analyzer` or `from scitran_client import flywheel_analyzer`.
 
 __all__ = [
     'ScitranClient',
+    'AsyncScitranClient',
     'query',
     'Files',
     'Collections',
@@ -27,5 +38,16 @@ __all__ = [
     'Acquisitions',
     'Groups',
     'compute_file_hash',
+    'FILE_DOWNLOAD_FIELDS',
+    'HashCache',
+    'BlobStore',
+    'RetryPolicy',
+    'CircuitBreaker',
+    'SearchCache',
+    'HTTPCache',
+    'RequestMetrics',
+    'SingleFlight',
+    'RateLimiter',
+    'Limit',
     'flywheel_analyzer',
 ]
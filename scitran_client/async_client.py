@@ -0,0 +1,79 @@
+from st_client import ScitranClient
+
+
+class AsyncScitranClient(object):
+    '''Non-blocking interface to a Scitran instance.
+
+    Offers the `request`, `search*`, `download_file` and `upload_analysis` methods of ScitranClient,
+    but every call returns a `concurrent.futures.Future` right away. Calls are executed by a shared
+    pool of `max_workers` threads, so any number of requests can be outstanding without a thread
+    per caller. Authentication and error handling are those of the wrapped ScitranClient: failed
+    requests resolve their future with the same st_exceptions.
+
+    > with AsyncScitranClient(max_workers=20) as client:
+    >   futures = [client.request('sessions/{}'.format(id)) for id in session_ids]
+    >   sessions = [f.result().json() for f in futures]
+
+    Attributes:
+        client (ScitranClient): The client that requests are dispatched with.
+    '''
+
+    def __init__(self, client=None, max_workers=10, **client_kwargs):
+        '''
+        Args:
+            client (ScitranClient, optional): Client to dispatch requests with. When not given, one is
+                created with `client_kwargs`.
+            max_workers (int): Maximum number of requests that are executed at the same time.
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.client = client or ScitranClient(**client_kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self, wait=True):
+        '''Stops accepting new calls. When `wait` is true, blocks until outstanding calls are done.'''
+        self._executor.shutdown(wait=wait)
+
+    def _submit(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def request(self, *args, **kwargs):
+        '''See ScitranClient.request. Returns a Future of the response.'''
+        return self._submit(self.client.request, *args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        '''See ScitranClient.search. Returns a Future of the search results.'''
+        return self._submit(self.client.search, *args, **kwargs)
+
+    def search_files(self, *args, **kwargs):
+        return self._submit(self.client.search_files, *args, **kwargs)
+
+    def search_collections(self, *args, **kwargs):
+        return self._submit(self.client.search_collections, *args, **kwargs)
+
+    def search_sessions(self, *args, **kwargs):
+        return self._submit(self.client.search_sessions, *args, **kwargs)
+
+    def search_projects(self, *args, **kwargs):
+        return self._submit(self.client.search_projects, *args, **kwargs)
+
+    def search_acquisitions(self, *args, **kwargs):
+        return self._submit(self.client.search_acquisitions, *args, **kwargs)
+
+    def download_file(self, *args, **kwargs):
+        '''See ScitranClient.download_file. Returns a Future of the downloaded file's path.
+
+        Progress bars are disabled unless `tqdm_disable=False` is passed, as concurrent bars garble each other.
+        '''
+        kwargs.setdefault('tqdm_disable', True)
+        return self._submit(self.client.download_file, *args, **kwargs)
+
+    def upload_analysis(self, *args, **kwargs):
+        '''See ScitranClient.upload_analysis. Returns a Future of the response.'''
+        return self._submit(self.client.upload_analysis, *args, **kwargs)
@@ -0,0 +1,187 @@
+import os
+import errno
+import fcntl
+import shutil
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from settings import HASH_PREFIX
+
+log = logging.getLogger('scitran.client.blob_store')
+
+# ioctl request number to clone a file on copy-on-write file systems (btrfs, xfs) on Linux.
+FICLONE = 0x40049409
+
+
+def _reflink_or_copy(src, dest):
+    '''Copies src to dest, sharing data blocks with src when the file system supports it.'''
+    with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+        try:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+            return
+        except (IOError, OSError):
+            pass
+        shutil.copyfileobj(src_file, dest_file, 1024 * 1024)
+
+
+def _link_or_copy(src, dest):
+    '''Atomically puts a hardlink (or, across devices, a copy) of src at dest.'''
+    tmp = '{}.{}.tmp'.format(dest, uuid.uuid4().hex)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        _reflink_or_copy(src, tmp)
+    try:
+        os.rename(tmp, dest)
+    finally:
+        # rename leaves tmp in place on failure, and when dest already was a hardlink to src.
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+
+
+class BlobStore(object):
+    '''Content-addressed store of downloaded files, keyed by Flywheel file hash.
+
+    Files are hardlinked between the store and download directories, so downloaded files should
+    be treated as read-only. The store is kept under `max_bytes` by evicting least recently used
+    files, and can be shared by several processes: files enter the store through an atomic rename
+    and eviction runs under a file lock.
+
+    The size of the store is counted once and then kept up to date as files are added, so adding
+    a file only walks the store when it is over budget or when the count is older than
+    `size_refresh_seconds`, which picks up files added by other processes.
+
+    Attributes:
+        root (str): Directory holding the store.
+        max_bytes (int): Size budget of the store.
+    '''
+
+    size_refresh_seconds = 60
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        # bytes in the store as far as this process knows, and when they were last counted.
+        self._size = None
+        self._size_counted = 0
+        self._size_lock = threading.Lock()
+        self._objects_dir = os.path.join(root, 'objects')
+        if not os.path.isdir(self._objects_dir):
+            try:
+                os.makedirs(self._objects_dir)
+            except OSError as e:
+                # another process might have created it in the meantime.
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def path_for(self, file_hash):
+        '''Returns the path of the blob with this hash, whether or not it is in the store.'''
+        assert file_hash.startswith(HASH_PREFIX)
+        digest = file_hash[len(HASH_PREFIX):]
+        return os.path.join(self._objects_dir, digest[:2], digest)
+
+    def get(self, file_hash):
+        '''Returns the path of the blob with this hash and marks it as used, or None when it is not stored.'''
+        blob_path = self.path_for(file_hash)
+        try:
+            # access time tracks usage. mtime is left alone as it is shared with hardlinked copies.
+            os.utime(blob_path, (time.time(), os.stat(blob_path).st_mtime))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        return blob_path
+
+    def link(self, file_hash, dest_path):
+        '''Places the blob with this hash at dest_path. Returns False when the blob is not stored.'''
+        blob_path = self.get(file_hash)
+        if blob_path is None:
+            return False
+        try:
+            _link_or_copy(blob_path, dest_path)
+        except (IOError, OSError) as e:
+            # The blob might have been evicted by another process.
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        return True
+
+    def add(self, file_hash, src_path):
+        '''Stores a file (which must have the content described by `file_hash`) and returns its blob path.'''
+        blob_path = self.path_for(file_hash)
+        blob_dir = os.path.dirname(blob_path)
+        if not os.path.isdir(blob_dir):
+            try:
+                os.mkdir(blob_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        added = not os.path.exists(blob_path)
+        _link_or_copy(src_path, blob_path)
+        stat = os.stat(blob_path)
+        os.utime(blob_path, (time.time(), stat.st_mtime))
+        with self._size_lock:
+            stale = self._size is None or time.time() - self._size_counted > self.size_refresh_seconds
+            if not stale and added:
+                self._size += stat.st_size
+            over_budget = stale or self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+        return blob_path
+
+    def discard(self, file_hash):
+        '''Removes a blob from the store, for instance when its content was found to be corrupt.'''
+        try:
+            os.remove(self.path_for(file_hash))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _blobs(self):
+        '''Returns a list of (last used, size, path) for every blob in the store.'''
+        blobs = []
+        for dirpath, _, filenames in os.walk(self._objects_dir):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((stat.st_atime, stat.st_size, path))
+        return blobs
+
+    def size(self):
+        '''Returns the number of bytes held by the store.'''
+        return sum(size for _, size, _ in self._blobs())
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.root, '.lock'), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def evict(self):
+        '''Removes least recently used blobs until the store fits in `max_bytes`.'''
+        with self._lock():
+            blobs = sorted(self._blobs())
+            total = sum(size for _, size, _ in blobs)
+            for _, size, path in blobs:
+                if total <= self.max_bytes:
+                    break
+                log.debug('Evicting {} from blob store.'.format(path))
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                total -= size
+            with self._size_lock:
+                self._size = total
+                self._size_counted = time.time()
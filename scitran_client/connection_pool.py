@@ -0,0 +1,66 @@
+import threading
+from requests.adapters import HTTPAdapter
+
+
+class ConnectionCounters(object):
+    '''Thread-safe counts of requests sent through a connection pool and of the connections opened for them.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def as_dict(self):
+        with self._lock:
+            return dict(
+                requests=self.requests,
+                new_connections=self.new_connections,
+                reused_connections=self.requests - self.new_connections,
+            )
+
+
+def _counting_pool_class(pool_class, counters):
+    '''Returns a subclass of a urllib3 connection pool class that reports to `counters`.'''
+    class CountingConnectionPool(pool_class):
+        def _make_request(self, conn, *args, **kwargs):
+            counters.count_request()
+            # connections are opened lazily, and pooled connections that the server closed are handed
+            # out again after they were closed on our end too. Either way, they have no socket yet.
+            if getattr(conn, 'sock', None) is None:
+                counters.count_new_connection()
+            return super(CountingConnectionPool, self)._make_request(conn, *args, **kwargs)
+
+    CountingConnectionPool.__name__ = 'Counting' + pool_class.__name__
+    return CountingConnectionPool
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    '''HTTPAdapter that counts how often requests reuse a pooled connection.
+
+    Takes the same pool arguments as HTTPAdapter: `pool_connections` is the number of hosts
+    that connections are kept for, `pool_maxsize` the number of connections kept per host, and
+    `pool_block` whether requests wait for a free connection instead of opening an extra one
+    when a host's pool is exhausted.
+
+    Attributes:
+        counters (ConnectionCounters): Connection counts for all hosts of this adapter.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.counters = ConnectionCounters()
+        super(CountingHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(CountingHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: _counting_pool_class(pool_class, self.counters)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
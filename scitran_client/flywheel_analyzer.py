@@ -305,7 +305,8 @@ def installed_client(client=None):
     >   print fa.find_project(label='ADHD study') # actually works!
     '''
     # BIG HACK
-    state['client'] = client or ScitranClient()
+    # The analyzer polls the same sessions over and over, which the HTTP cache makes cheap.
+    state['client'] = client or ScitranClient(http_cache=True)
     try:
         yield state['client']
     finally:
@@ -319,6 +320,8 @@ def run(operations, project=None, max_workers=10, session_limit=None):
     max_workers - Number of sessions that can be run at the same time. This
         number is dependent on a number of factors: How many CPUs your pipeline
         will use and how many CPUs you can use from your Flywheel Engine instance.
+        The installed client should have a `pool_maxsize` of at least `max_workers`,
+        so that threads do not have to open new connections.
     session_limit - Used to test pipelines out by limiting the number of sessions
         the pipeline code will run on.
 
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+
+def _file_signature(abs_file_path):
+    '''Returns (size, mtime_ns, inode) for a file. A change in any of these means the file may have changed.'''
+    stat = os.stat(abs_file_path)
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return stat.st_size, mtime_ns, stat.st_ino
+
+
+class HashCache(object):
+    '''Persistent cache of the Flywheel hashes of local files.
+
+    Hashes are stored in a sqlite database so that repeated runs over the same files
+    do not have to read them again. An entry is only used while the size, mtime and inode
+    of the file are the same as when it was hashed.
+
+    Attributes:
+        path (str): Path to the sqlite database holding the cache.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        cache_dir = os.path.dirname(path)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS file_hashes ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, hash TEXT)')
+
+    @contextmanager
+    def _connect(self):
+        # A connection per operation keeps the cache usable from several threads and processes.
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, abs_file_path):
+        '''Returns the cached hash of a file, or None when it is unknown or the file has changed.'''
+        abs_file_path = os.path.abspath(abs_file_path)
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT size, mtime_ns, inode, hash FROM file_hashes WHERE path = ?',
+                (abs_file_path,)).fetchone()
+        if row is None or tuple(row[:3]) != _file_signature(abs_file_path):
+            return None
+        return row[3]
+
+    def put(self, abs_file_path, file_hash):
+        '''Records the hash of a file in its current state.'''
+        abs_file_path = os.path.abspath(abs_file_path)
+        size, mtime_ns, inode = _file_signature(abs_file_path)
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, hash) VALUES (?, ?, ?, ?, ?)',
+                (abs_file_path, size, mtime_ns, inode, file_hash))
+
+    def invalidate(self, abs_file_path=None):
+        '''Removes the entry for a file, or every entry when no path is given.'''
+        with self._connect() as conn:
+            if abs_file_path is None:
+                conn.execute('DELETE FROM file_hashes')
+            else:
+                conn.execute('DELETE FROM file_hashes WHERE path = ?', (os.path.abspath(abs_file_path),))
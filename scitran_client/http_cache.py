@@ -0,0 +1,99 @@
+import copy
+import threading
+from collections import OrderedDict
+
+
+def params_key(params):
+    '''Returns a hashable form of request parameters, which requests accepts as a dict, a list of
+    (name, value) pairs or a string. Dicts give the same key whatever the order of their items.'''
+    if params is None:
+        return ''
+    if hasattr(params, 'items'):
+        params = sorted(params.items())
+    return repr(params)
+
+
+class HTTPCache(object):
+    '''In-memory cache of GET responses that are revalidated with the server before they are used.
+
+    Responses that carry an ETag or Last-Modified header are stored. When the same URL is
+    requested again, the request is sent with If-None-Match / If-Modified-Since, and when the
+    server answers 304 Not Modified the stored response is returned instead of downloading
+    the document again. At most `max_entries` responses are kept, least recently used first out.
+
+    Attributes:
+        hits (int): Number of requests answered with a stored response.
+        misses (int): Number of requests whose response had to be downloaded.
+        bytes_saved (int): Number of response body bytes that did not have to be downloaded.
+    '''
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def key(url, params):
+        return url, params_key(params)
+
+    def get(self, key):
+        '''Returns the stored response for a key, or None.'''
+        with self._lock:
+            response = self._entries.pop(key, None)
+            if response is not None:
+                self._entries[key] = response
+            return response
+
+    @staticmethod
+    def conditional_headers(response):
+        '''Returns the headers that ask the server whether `response` is still current.'''
+        headers = {}
+        if response.headers.get('ETag'):
+            headers['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = response.headers['Last-Modified']
+        return headers
+
+    def update(self, key, cached, response):
+        '''Handles the response to a (possibly conditional) request and returns the response to use.
+
+        Args:
+            key: Cache key of the request.
+            cached (requests.Response): Stored response the request was made conditional on, or None.
+            response (requests.Response): Response received from the server.
+        '''
+        if response.status_code == 304 and cached is not None:
+            result = copy.copy(cached)
+            result.request = response.request
+            result.elapsed = response.elapsed
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += len(cached.content)
+            return result
+
+        with self._lock:
+            self.misses += 1
+            if response.status_code == 200 and self.conditional_headers(response):
+                self._entries.pop(key, None)
+                self._entries[key] = response
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        '''Returns the number of hits and misses, the hit rate and the number of bytes saved.'''
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=float(self.hits) / requests if requests else None,
+                bytes_saved=self.bytes_saved,
+            )
@@ -0,0 +1,94 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _Buffer(object):
+    '''Text decoded from an iterable of byte chunks, read on demand.'''
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = u''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        '''Reads more text. Returns False at the end of the input.'''
+        # drop what has been consumed so the buffer stays about the size of one value.
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self.text += text
+                return True
+        self.eof = True
+        return False
+
+    def peek(self):
+        '''Returns the next character that is not whitespace without consuming it, or None at the end.'''
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise ValueError('Expected one of {!r} in JSON stream, found {!r}'.format(chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        '''Decodes and consumes the next JSON value.'''
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except ValueError:
+                if self.fill():
+                    continue
+                raise
+            # a number at the end of the buffer might continue in the next chunk.
+            if end == len(self.text) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_object_array(chunks, key):
+    '''Yields the items of the array at `key` in the JSON object made up by `chunks`, one at a time.
+
+    Only the item being decoded is held in memory (along with the other, small, values of the
+    object), so arbitrarily large arrays can be processed.
+
+    Args:
+        chunks (iterable): Byte strings of UTF-8 encoded JSON, like `response.iter_content(...)`.
+        key (str): Key of the array in the top level object.
+    '''
+    buf = _Buffer(chunks)
+    buf.expect('{')
+    if buf.peek() == '}':
+        return
+    while True:
+        name = buf.value()
+        buf.expect(':')
+        if name == key and buf.peek() == '[':
+            buf.expect('[')
+            if buf.peek() == ']':
+                buf.expect(']')
+            else:
+                while True:
+                    yield buf.value()
+                    if buf.expect(',]') == ']':
+                        break
+        else:
+            buf.value()
+        if buf.expect(',}') == '}':
+            return
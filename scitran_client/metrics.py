@@ -0,0 +1,139 @@
+import bisect
+import json
+import re
+import threading
+
+_ID_PATTERN = re.compile(r'^([0-9a-f]{24}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d+)$')
+
+# Upper bounds, in seconds, of the latency histogram buckets: 1ms to about 10 minutes in steps of 50%.
+LATENCY_BUCKETS = tuple(.001 * 1.5 ** i for i in range(34))
+
+
+def endpoint_template(endpoint):
+    '''Replaces the IDs and file names in an endpoint with placeholders.
+
+    > endpoint_template('sessions/5890a2ba7a3b2c001ca3c4b6/analyses')
+    'sessions/{id}/analyses'
+    '''
+    segments = endpoint.split('?', 1)[0].strip('/').split('/')
+    template = []
+    for index, segment in enumerate(segments):
+        previous = segments[index - 1] if index else None
+        if previous == 'files':
+            template.append('{name}')
+        elif previous == 'groups' or _ID_PATTERN.match(segment):
+            # group IDs are chosen by users, so they do not look like other IDs.
+            template.append('{id}')
+        else:
+            template.append(segment)
+    return '/'.join(template)
+
+
+class _EndpointStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def percentile(self, fraction):
+        '''Returns the upper bound of the histogram bucket the `fraction` percentile falls in.'''
+        if not self.requests:
+            return None
+        rank = fraction * self.requests
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float('inf')
+
+    def as_dict(self):
+        return dict(
+            requests=self.requests,
+            errors=self.errors,
+            seconds=self.seconds,
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out,
+            p50=self.percentile(.5),
+            p95=self.percentile(.95),
+            p99=self.percentile(.99),
+        )
+
+
+class RequestMetrics(object):
+    '''Request counts, latency histograms, transferred bytes and errors per method and endpoint template.
+
+    Latencies are counted in fixed histogram buckets, so recording a request takes constant time
+    and memory, and percentiles are accurate to the bucket size (50%).
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, method, endpoint, seconds, bytes_in=0, bytes_out=0, error=False):
+        '''Records a request to `endpoint` (which may contain IDs) that took `seconds`.'''
+        key = (method.upper(), endpoint_template(endpoint))
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = _EndpointStats()
+            stats.requests += 1
+            stats.errors += bool(error)
+            stats.seconds += seconds
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            stats.buckets[bucket] += 1
+
+    def as_dict(self):
+        '''Returns the metrics of every endpoint, keyed by "<METHOD> <endpoint template>".'''
+        with self._lock:
+            return {
+                '{} {}'.format(method, template): stats.as_dict()
+                for (method, template), stats in self._endpoints.iteritems()
+            }
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True, indent=2)
+
+    def to_prometheus(self, prefix='scitran_client'):
+        '''Returns the metrics in the Prometheus text exposition format.'''
+        lines = []
+
+        def _format_sample(name, labels, value):
+            return '{}{{{}}} {}'.format(
+                name, ','.join('{}="{}"'.format(k, v) for k, v in labels),
+                repr(value) if isinstance(value, float) else value)
+
+        def _add(name, kind, help_text, samples):
+            name = '{}_{}'.format(prefix, name)
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for suffix, labels, value in samples:
+                lines.append(_format_sample(name + suffix, labels, value))
+
+        with self._lock:
+            labelled = [
+                ((('method', method), ('endpoint', template)), stats)
+                for (method, template), stats in sorted(self._endpoints.iteritems())
+            ]
+            histogram = []
+            for labels, stats in labelled:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (None,), stats.buckets):
+                    cumulative += count
+                    le = '+Inf' if bound is None else '{:.6g}'.format(bound)
+                    histogram.append(('_bucket', labels + (('le', le),), cumulative))
+                histogram.append(('_sum', labels, stats.seconds))
+                histogram.append(('_count', labels, stats.requests))
+            _add('request_duration_seconds', 'histogram', 'Latency of requests.', histogram)
+            _add('request_errors_total', 'counter', 'Number of failed requests.',
+                 [('', labels, stats.errors) for labels, stats in labelled])
+            _add('response_bytes_total', 'counter', 'Bytes received.',
+                 [('', labels, stats.bytes_in) for labels, stats in labelled])
+            _add('request_bytes_total', 'counter', 'Bytes sent.',
+                 [('', labels, stats.bytes_out) for labels, stats in labelled])
+        return '\n'.join(lines) + '\n'
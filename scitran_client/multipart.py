@@ -0,0 +1,99 @@
+import os
+import uuid
+from requests.packages.urllib3.fields import RequestField
+
+
+def _render_part_headers(boundary, name, filename=None):
+    '''Renders the boundary and headers of a part the way requests does for `files=`.'''
+    field = RequestField(name, None, filename=filename)
+    field.make_multipart()
+    headers = field.render_headers()
+    if isinstance(headers, unicode):
+        headers = headers.encode('utf-8')
+    return b'--' + boundary + b'\r\n' + headers
+
+
+class MultipartEncoder(object):
+    '''A multipart/form-data request body that is read from disk while it is sent.
+
+    Unlike the `files=` argument of requests, which builds the whole body in memory, this only
+    keeps the part headers in memory and reads files as the body is consumed. The length of the
+    body is known up front, so requests sends it with a Content-Length header.
+
+    > body = MultipartEncoder([('metadata', '{}')], [('file1', 'brain.nii.gz', '/data/brain.nii.gz')])
+    > client.request('...', method='POST', data=body, headers={'Content-Type': body.content_type})
+
+    Args:
+        fields (list): (name, value) tuples of form fields.
+        files (list): (name, filename, path) tuples of files to send.
+        callback (callable, optional): Called with the number of bytes read so far and the total length
+            of the body whenever a chunk of the body is read.
+    '''
+
+    def __init__(self, fields, files, callback=None, boundary=None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(self.boundary)
+        self.callback = callback
+
+        # Segments are either strings or paths of files, marked by a tuple.
+        self._segments = []
+        for name, value in fields:
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            self._segments.append(_render_part_headers(self.boundary, name) + value + b'\r\n')
+        for name, filename, path in files:
+            self._segments.append(_render_part_headers(self.boundary, name, filename))
+            self._segments.append((path,))
+            self._segments.append(b'\r\n')
+        self._segments.append(b'--' + self.boundary + b'--\r\n')
+
+        self.len = sum(
+            os.path.getsize(segment[0]) if isinstance(segment, tuple) else len(segment)
+            for segment in self._segments
+        )
+        self.bytes_read = 0
+        self._index = 0
+        self._offset = 0
+        self._file = None
+
+    def __len__(self):
+        return self.len
+
+    def __iter__(self):
+        return iter(lambda: self.read(64 * 1024), b'')
+
+    def read(self, size=-1):
+        '''Reads up to `size` bytes of the body, or the rest of the body when `size` is negative.'''
+        chunks = []
+        remaining = size if size >= 0 else self.len
+        while remaining > 0 and self._index < len(self._segments):
+            segment = self._segments[self._index]
+            if isinstance(segment, tuple):
+                if self._file is None:
+                    self._file = open(segment[0], 'rb')
+                chunk = self._file.read(remaining)
+                if not chunk:
+                    self._file.close()
+                    self._file = None
+                    self._index += 1
+                    continue
+            else:
+                chunk = segment[self._offset:self._offset + remaining]
+                self._offset += len(chunk)
+                if self._offset >= len(segment):
+                    self._index += 1
+                    self._offset = 0
+            chunks.append(chunk)
+            remaining -= len(chunk)
+
+        data = b''.join(chunks)
+        self.bytes_read += len(data)
+        if self.callback and data:
+            self.callback(self.bytes_read, self.len)
+        return data
+
+    def close(self):
+        '''Closes the file that is currently being read, if any.'''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -71,9 +71,26 @@ class Query(object):
             self.path = path._name
         else:
             self.path = path
+        self._source = None
+
+    def source(self, includes=None, excludes=None):
+        '''
+        Limits the fields of `_source` returned for each result. Smaller results
+        are faster to transfer and decode, which matters for large searches.
+
+        > query(Files).source(includes=['name', 'hash']).filter(...)
+        '''
+        self._source = {}
+        if includes is not None:
+            self._source['includes'] = includes
+        if excludes is not None:
+            self._source['excludes'] = excludes
+        return self
 
     def filter(self, *filters):
         result = dict(path=self.path)
+        if self._source is not None:
+            result['_source'] = self._source
 
         # group filters by document name
         filters_by_document = {}
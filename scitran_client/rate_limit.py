@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+# Classes of endpoints that are limited separately.
+SEARCH = 'search'
+METADATA = 'metadata'
+FILES = 'files'
+
+
+class Limit(namedtuple('Limit', ['rate', 'max_in_flight', 'burst'])):
+    '''Limits for a class of endpoints. Any of them can be None for no limit.
+
+    Args:
+        rate (float): Requests started per second, on average.
+        max_in_flight (int): Requests that can be in flight at the same time.
+        burst (int): Requests that can be started at once after a quiet period. Defaults to `rate`.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, rate=None, max_in_flight=None, burst=None):
+        return super(Limit, cls).__new__(cls, rate, max_in_flight, burst)
+
+
+DEFAULT_LIMITS = {
+    SEARCH: Limit(rate=5, max_in_flight=4),
+    METADATA: Limit(rate=20, max_in_flight=20),
+    FILES: Limit(rate=10, max_in_flight=8),
+}
+
+
+def endpoint_class(endpoint):
+    '''Returns the class of an endpoint: SEARCH, FILES (uploads, downloads and tickets) or METADATA.'''
+    segments = endpoint.split('?', 1)[0].strip('/').split('/')
+    if segments[0] == SEARCH:
+        return SEARCH
+    if 'files' in segments or segments[0] == 'download':
+        return FILES
+    return METADATA
+
+
+class TokenBucket(object):
+    '''Lets `rate` calls per second through, with bursts of up to `burst` calls.'''
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst or rate))
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Blocks until the call may proceed and returns the number of seconds waited.'''
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # the token is taken right away, even when that leaves a debt. Callers are thus
+            # let through in the order they arrived, each 1 / rate seconds after the previous one.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class _ClassLimiter(object):
+    def __init__(self, limit):
+        self.bucket = TokenBucket(limit.rate, limit.burst) if limit.rate else None
+        self.slots = threading.BoundedSemaphore(limit.max_in_flight) if limit.max_in_flight else None
+        self.requests = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.in_flight = 0
+
+
+class RateLimiter(object):
+    '''Limits the rate and concurrency of requests, separately for searches, metadata and file transfers.
+
+    Bursts of requests, like those of many threads polling sessions at once, are spread out
+    so that they do not trip the throttling of the server. A limiter is shared by all threads
+    using a client. Requests wait for their turn; how long they waited is reported by `stats`.
+
+    Streamed responses, like file downloads, are in flight until their body has been read or
+    they are closed, so `max_in_flight` also limits the number of concurrent transfers.
+
+    > client = ScitranClient(rate_limiter=RateLimiter({SEARCH: Limit(rate=2, max_in_flight=1)}))
+
+    Args:
+        limits (dict): Limit for each class of endpoints (SEARCH, METADATA and FILES). Classes
+            without a limit are not limited. Defaults to DEFAULT_LIMITS.
+    '''
+
+    def __init__(self, limits=None):
+        self.limits = DEFAULT_LIMITS if limits is None else limits
+        self._classes = {name: _ClassLimiter(limit) for name, limit in self.limits.items()}
+        self._lock = threading.Lock()
+
+    def acquire(self, name):
+        '''Waits until a request of class `name` may be sent and takes a slot for it, which is given back
+        with `release`.'''
+        limiter = self._classes.get(name)
+        if limiter is None:
+            return
+
+        start = time.time()
+        if limiter.bucket:
+            limiter.bucket.acquire()
+        if limiter.slots:
+            limiter.slots.acquire()
+        waited = time.time() - start
+        with self._lock:
+            limiter.requests += 1
+            limiter.in_flight += 1
+            # waits shorter than this are only the cost of taking the locks.
+            if waited > 1e-4:
+                limiter.waited += 1
+            limiter.wait_seconds += waited
+            limiter.max_wait_seconds = max(limiter.max_wait_seconds, waited)
+
+    def release(self, name):
+        '''Gives back the slot taken by `acquire` for a request of class `name`.'''
+        limiter = self._classes.get(name)
+        if limiter is None:
+            return
+        with self._lock:
+            limiter.in_flight -= 1
+        if limiter.slots:
+            limiter.slots.release()
+
+    @contextmanager
+    def limit(self, name):
+        '''Waits until a request of class `name` may be sent, and holds a slot for it while in the block.'''
+        self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def stats(self):
+        '''Returns, for every class, the number of requests, how many of them had to wait, the total and
+        longest wait in seconds and the number of requests currently in flight.'''
+        with self._lock:
+            return {
+                name: dict(
+                    requests=limiter.requests,
+                    waited=limiter.waited,
+                    wait_seconds=limiter.wait_seconds,
+                    max_wait_seconds=limiter.max_wait_seconds,
+                    in_flight=limiter.in_flight,
+                )
+                for name, limiter in self._classes.items()
+            }
@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+from email.utils import parsedate_tz, mktime_tz
+import st_exceptions
+
+# Status codes that signal a temporary problem with the server.
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# Requests with these methods can be sent again without changing their effect.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+def _parse_retry_after(value):
+    '''Returns the number of seconds a Retry-After header (in seconds or as an HTTP date) asks us to wait.'''
+    if not value:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, mktime_tz(date) - time.time())
+
+
+class CircuitBreaker(object):
+    '''Stops sending requests to a server that keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens, and requests fail right away
+    with st_exceptions.CircuitOpen instead of adding to the load of the server. After `reset_timeout`
+    seconds a single trial request is let through: when it succeeds the circuit closes again,
+    otherwise it stays open for another `reset_timeout` seconds.
+
+    A breaker is shared by all threads using a client, so a server that is down is only probed by
+    one of them.
+    '''
+
+    def __init__(self, failure_threshold=10, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.rejected = 0
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_request(self):
+        '''Raises st_exceptions.CircuitOpen when a request should not be sent.'''
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if not self._trial_in_flight and time.time() - self._opened_at >= self.reset_timeout:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+        raise st_exceptions.CircuitOpen(
+            'Not sending request: the server failed {} times in a row.'.format(self._failures))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+            self._trial_in_flight = False
+
+
+class RetryPolicy(object):
+    '''Decides when and after how long failed requests are sent again.
+
+    Requests with an idempotent method are retried up to `max_retries` times when the connection
+    fails or the server responds with one of `status_codes`. Retries wait for the time requested
+    by a Retry-After header, or for a random time between zero and an exponentially growing
+    bound (`backoff_factor * 2 ** retry`, at most `max_backoff` seconds). The random "jitter"
+    keeps many threads from retrying at the same moment.
+
+    Attributes:
+        circuit_breaker (CircuitBreaker): Breaker consulted before each request, or None.
+    '''
+
+    def __init__(
+        self, max_retries=3, backoff_factor=0.5, max_backoff=30,
+        status_codes=RETRY_STATUS_CODES, methods=IDEMPOTENT_METHODS,
+        circuit_breaker=True
+    ):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.status_codes = status_codes
+        self.methods = methods
+        if circuit_breaker is True:
+            circuit_breaker = CircuitBreaker()
+        self.circuit_breaker = circuit_breaker or None
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.retry_seconds = 0.0
+        self.exhausted = 0
+
+    def should_retry(self, method, retry):
+        '''Returns whether a failed request with `method` should be sent for the `retry`th time.'''
+        if method.upper() not in self.methods:
+            return False
+        if retry > self.max_retries:
+            with self._lock:
+                self.exhausted += 1
+            return False
+        return True
+
+    def backoff(self, retry, response=None):
+        '''Returns the number of seconds to wait before the `retry`th retry.'''
+        if response is not None:
+            retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** (retry - 1)))
+
+    def wait(self, retry, response=None):
+        '''Sleeps before the `retry`th retry and records it.'''
+        seconds = self.backoff(retry, response)
+        time.sleep(seconds)
+        with self._lock:
+            self.retries += 1
+            self.retry_seconds += seconds
+
+    def stats(self):
+        '''Returns the number of retries, the time spent waiting for them and the state of the circuit breaker.'''
+        with self._lock:
+            stats = dict(retries=self.retries, retry_seconds=self.retry_seconds, exhausted=self.exhausted)
+        if self.circuit_breaker:
+            stats.update(
+                circuit_open=self.circuit_breaker.is_open,
+                circuit_rejected=self.circuit_breaker.rejected)
+        return stats
@@ -0,0 +1,115 @@
+import errno
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def canonical_search_key(search_body, *context):
+    '''Returns a cache key for a search that does not depend on the order of keys in `search_body`.
+
+    `context` holds anything else the results depend on, like the server and the user's token.
+    '''
+    canonical = json.dumps([search_body, context], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SearchCache(object):
+    '''On-disk cache of search results.
+
+    Results are stored gzip-compressed, one file per distinct search, and are used for `ttl`
+    seconds after they were fetched. Searches are identified by their body, so two queries
+    built with the same filters in a different order share an entry. Expired entries are
+    removed when they are looked up, and `put` sweeps the others at most once per `ttl`.
+
+    Attributes:
+        root (str): Directory holding the cached results.
+        ttl (int): Number of seconds results are used for.
+        hits (int): Number of searches answered from the cache.
+        misses (int): Number of searches that had to be sent to the server.
+    '''
+
+    def __init__(self, root, ttl=3600):
+        self.root = root
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._last_prune = 0
+        if not os.path.isdir(root):
+            try:
+                os.makedirs(root)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.json.gz')
+
+    def get(self, key):
+        '''Returns the cached results for a key, or None when there are none or they have expired.'''
+        path = self._path(key)
+        try:
+            fresh = time.time() - os.path.getmtime(path) < self.ttl
+            if fresh:
+                with gzip.open(path, 'rb') as f:
+                    results = json.loads(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            # missing, concurrently removed, or partially written by an older version.
+            fresh = False
+        if not fresh:
+            self._remove_if_expired(path)
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return results if fresh else None
+
+    def put(self, key, results):
+        '''Stores the results for a key.'''
+        path = self._path(key)
+        tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with gzip.open(tmp, 'wb') as f:
+            f.write(json.dumps(results).encode('utf-8'))
+        os.rename(tmp, path)
+
+        now = time.time()
+        with self._lock:
+            prune = now - self._last_prune >= self.ttl
+            if prune:
+                self._last_prune = now
+        if prune:
+            self.prune()
+
+    def _remove_if_expired(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) >= self.ttl:
+                os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def prune(self):
+        '''Removes expired results, and temporary files left behind by interrupted writes.'''
+        for filename in os.listdir(self.root):
+            if filename.endswith('.json.gz') or filename.endswith('.tmp'):
+                self._remove_if_expired(os.path.join(self.root, filename))
+
+    def clear(self):
+        '''Removes every cached result.'''
+        for filename in os.listdir(self.root):
+            if filename.endswith('.json.gz'):
+                try:
+                    os.remove(os.path.join(self.root, filename))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+
+    def stats(self):
+        '''Returns the number of cache hits and misses.'''
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses)
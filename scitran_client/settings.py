@@ -6,6 +6,20 @@ EXEC_HOME = os.path.dirname(__file__)
 USER_HOME = os.path.expanduser("~")
 
 AUTH_DIR = os.path.join(USER_HOME, '.scitran_client')
+# The name of the file, next to auth.json, that records when API keys were last found to be valid.
+TOKEN_CACHE_FILENAME = 'token_cache.json'
+# Number of seconds a successful validation of an API key is trusted for.
+TOKEN_CACHE_TTL = 24 * 60 * 60
+# The name of the file hash cache kept in the client's st_dir.
+HASH_CACHE_FILENAME = 'hash_cache.sqlite'
+# The name of the directory in the client's st_dir used for the content-addressed blob store.
+BLOB_STORE_DIRNAME = 'blobs'
+DEFAULT_BLOB_STORE_MAX_BYTES = 20 * 1024 ** 3
+# The name of the directory in the client's st_dir used for cached search results.
+SEARCH_CACHE_DIRNAME = 'search_cache'
+
+# Prefix of the file hashes computed by Flywheel.
+HASH_PREFIX = 'v0-sha384-'
 
 DEFAULT_DOWNLOADS_DIR = os.path.join(USER_HOME, 'Downloads')
 DEFAULT_INPUT_DIR = os.path.join(DEFAULT_DOWNLOADS_DIR, 'input')
@@ -0,0 +1,60 @@
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''Collapses concurrent calls with the same key into one.
+
+    While a call for a key is in flight, other threads calling `do` with that key wait for it
+    and get its result (or its exception) instead of making the call themselves. Calls made
+    after it finished are made again, so results are never older than the call they waited for.
+
+    Attributes:
+        calls (int): Number of calls that were made.
+        collapsed (int): Number of calls that shared the result of a call in flight.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    def do(self, key, fn):
+        '''Returns `fn()`, or the result of the call in flight for `key`.'''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        '''Returns the number of calls made and the number of calls collapsed into them.'''
+        with self._lock:
+            return dict(calls=self.calls, collapsed=self.collapsed)
@@ -1,6 +1,9 @@
 from __future__ import print_function
 
 import os
+import time
+import uuid
+import hashlib
 from shutil import copyfile
 import json
 import settings
@@ -8,31 +11,76 @@ from getpass import getpass
 from requests import request
 
 
-def _is_valid_token(url, api_key):
+def _is_valid_token(url, api_key, session=None):
     # wish it were easier to share this code with ScitranClient, but
     # that would require more tightly coupling this to that.
-    return request('GET', url + '/api/users/self', headers={
+    # Passing the client's session lets the check reuse its pooled connections.
+    return (session.request if session else request)('GET', url + '/api/users/self', headers={
         'Authorization': 'scitran-user ' + api_key
     }).status_code == 200
 
 
-def _prompt_for_valid_api_key(url):
+def _prompt_for_valid_api_key(url, session=None):
     prompt = 'Enter your API key here: '
     api_key = getpass(prompt)
-    while not _is_valid_token(url, api_key):
+    while not _is_valid_token(url, api_key, session):
         print('Sorry, that key was not valid for {}'.format(url))
         api_key = getpass(prompt)
     return api_key
 
 
-def create_token(instance_name_or_host, config_dir):
+def _token_cache_key(url, api_key):
+    # keys are hashed so the cache does not become another copy of the secrets in auth.json.
+    return hashlib.sha256(url + '\n' + api_key).hexdigest()
+
+
+def _read_token_cache(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_token_cache(path, cache):
+    tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    with open(tmp, 'w') as f:
+        json.dump(cache, f)
+    os.rename(tmp, path)
+
+
+def _validate_token(url, api_key, cache_path, ttl, session=None):
+    '''Returns whether `api_key` is valid for `url`, trusting validations made less than `ttl` seconds ago.'''
+    cache = _read_token_cache(cache_path)
+    key = _token_cache_key(url, api_key)
+    now = time.time()
+    if now - cache.get(key, 0) < ttl:
+        return True
+    valid = _is_valid_token(url, api_key, session)
+    if valid:
+        cache[key] = now
+    else:
+        cache.pop(key, None)
+    _write_token_cache(cache_path, cache)
+    return valid
+
+
+def create_token(instance_name_or_host, config_dir, validate=True, ttl=settings.TOKEN_CACHE_TTL, session=None):
     '''
     Get an API key for this instance, requesting a new one if no previous one exists.
 
+    Successful validations of a key are recorded in a cache file next to auth.json and trusted for
+    `ttl` seconds, so the key is only checked with the server again once that time has passed.
+
     Args:
         instance_name (str): The instance to generate a token for. Should only have one of `instance_name` or `host`.
         host (str): The host we are are trying to generate a token for.
         config_dir (str): Path of directory where the tokens live.
+        validate (bool, optional): When false, a configured key is returned without checking it with the
+            server. Use this when failed requests are handled by validating the key again.
+        ttl (int, optional): Number of seconds a successful validation is trusted for. Pass 0 to
+            always check the key with the server.
+        session (requests.Session, optional): Session used to check the key with the server.
 
     Returns:
         Python tuple: (token (str), client_url (str)): (The requested token, the base url for this client)
@@ -66,14 +114,19 @@ def create_token(instance_name_or_host, config_dir):
         .format(auth_path, instance_name_or_host, example))
 
     # We just wipe out keys that are invalid.
-    if auth['api_key'] and not _is_valid_token(auth['url'], auth['api_key']):
+    cache_path = os.path.join(config_dir, settings.TOKEN_CACHE_FILENAME)
+    if auth['api_key'] and validate and not _validate_token(
+            auth['url'], auth['api_key'], cache_path, ttl, session):
         auth['api_key'] = None
 
     if not auth['api_key']:
         print('You can find your API key by visiting {} and scrolling to the bottom of the page.'.format(
             auth['url'] + '/#/profile'))
         print('If your key is blank, then click "Generate API Key"')
-        auth['api_key'] = _prompt_for_valid_api_key(auth['url'])
+        auth['api_key'] = _prompt_for_valid_api_key(auth['url'], session)
+        cache = _read_token_cache(cache_path)
+        cache[_token_cache_key(auth['url'], auth['api_key'])] = time.time()
+        _write_token_cache(cache_path, cache)
 
         with open(auth_path, 'w') as f:
             json.dump(auth_config, f, indent=4)
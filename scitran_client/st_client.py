@@ -1,31 +1,73 @@
 from __future__ import print_function
 
 import os
+import io
+import copy
+import errno
 import requests
 import st_exceptions
 import st_auth
 import urlparse
 import json
 import shutil
-import st_docker
+from hash_cache import HashCache
+from blob_store import BlobStore, _link_or_copy
+from connection_pool import CountingHTTPAdapter
+from retry import RetryPolicy
+from multipart import MultipartEncoder
+from search_cache import SearchCache, canonical_search_key
+from http_cache import HTTPCache, params_key
+from json_stream import iter_object_array
+from metrics import RequestMetrics
+from single_flight import SingleFlight
+from rate_limit import RateLimiter, endpoint_class
 from settings import (
     AUTH_DIR,
+    BLOB_STORE_DIRNAME,
+    DEFAULT_BLOB_STORE_MAX_BYTES,
     DEFAULT_DOWNLOADS_DIR,
     DEFAULT_INPUT_DIR,
     DEFAULT_OUTPUT_DIR,
+    HASH_CACHE_FILENAME,
+    HASH_PREFIX,
+    SEARCH_CACHE_DIRNAME,
 )
-import tqdm as tqdm_module
 import ssl
 import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
 
 log = logging.getLogger('scitran.client')
 
-try:
-    __IPYTHON__  # NOQA
-    tqdm = tqdm_module.tqdm_notebook
-except NameError:
-    tqdm = tqdm_module.tqdm
+
+# tqdm keeps a registry of open bars that breaks when bars are created or closed by several
+# threads at once, so that is done under this lock.
+_tqdm_lock = threading.RLock()
+_tqdm_factory = None
+
+
+def tqdm(*args, **kwargs):
+    '''Creates a tqdm progress bar, a notebook widget when running in IPython.
+
+    tqdm is imported on first use, which keeps `import scitran_client` fast.
+    '''
+    global _tqdm_factory
+    if _tqdm_factory is None:
+        import tqdm as tqdm_module
+        try:
+            __IPYTHON__  # NOQA
+            _tqdm_factory = tqdm_module.tqdm_notebook
+        except NameError:
+            class _ThreadSafeTqdm(tqdm_module.tqdm):
+                def close(self):
+                    with _tqdm_lock:
+                        super(_ThreadSafeTqdm, self).close()
+            _tqdm_factory = _ThreadSafeTqdm
+    with _tqdm_lock:
+        return _tqdm_factory(*args, **kwargs)
+
 
 if not hasattr(ssl, 'PROTOCOL_TLSv1_2'):
     print(
@@ -35,20 +77,146 @@ if not hasattr(ssl, 'PROTOCOL_TLSv1_2'):
 
 __author__ = 'vsitzmann'
 
-HASH_PREFIX = 'v0-sha384-'
 
+# Size of the reusable buffer that files are hashed through.
+HASH_CHUNK_SIZE = 1024 * 1024
+# Bounds for the chunk size used to stream downloads to disk. See _adaptive_chunk_size.
+MIN_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
 
-def compute_file_hash(abs_file_path):
+
+def compute_file_hash(abs_file_path, chunk_size=HASH_CHUNK_SIZE):
     '''
     Computes the hash used by Flywheel for this file.
     Uses sha384 hash, along with Flywheel's hash prefix. Data is read from
-    the file in chunks to avoid loading it all in memory.
+    the file in chunks of `chunk_size` bytes to avoid loading it all in memory.
+    '''
+    return HASH_PREFIX + _update_hash(hashlib.new('sha384'), abs_file_path, chunk_size).hexdigest()
+
+
+def _update_hash(h, abs_file_path, chunk_size=HASH_CHUNK_SIZE):
+    '''Feeds the content of a file into the hash object `h` and returns it.
+
+    The file is read into a single preallocated buffer, so no new string is created per chunk.
     '''
-    h = hashlib.new('sha384')
-    with open(abs_file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            h.update(chunk)
-    return HASH_PREFIX + h.hexdigest()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with io.open(abs_file_path, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            h.update(view[:size])
+    return h
+
+
+def _adaptive_chunk_size(content_length):
+    '''Picks the chunk size used to stream a response of `content_length` bytes to disk.
+
+    Large files are streamed in large chunks to keep the per-chunk overhead of Python low,
+    small files in small chunks so we do not allocate more than we need.
+    '''
+    chunk_size = MIN_DOWNLOAD_CHUNK_SIZE
+    while chunk_size < MAX_DOWNLOAD_CHUNK_SIZE and chunk_size * 256 < (content_length or 0):
+        chunk_size *= 2
+    return chunk_size
+
+
+def _content_range_start(response):
+    '''Returns the first byte position of a `Content-Range: bytes <start>-<end>/<size>` header, or None.'''
+    content_range = response.headers.get('Content-Range', '')
+    if not content_range.startswith('bytes '):
+        return None
+    try:
+        return int(content_range[len('bytes '):].split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+# The `_source` fields of file search results used by ScitranClient.download_all_file_search_results.
+FILE_DOWNLOAD_FIELDS = ['container_name', 'acquisition._id', 'name', 'hash', 'size']
+
+
+def _colliding_destinations(file_search_results, dest_dir):
+    '''Returns an error for every file search result that would be downloaded to the same path as a
+    result with different content, keyed by the index of the result.'''
+    hashes_by_path = {}
+    for file_search_result in file_search_results:
+        source = file_search_result['_source']
+        hashes_by_path.setdefault(os.path.join(dest_dir, source['name']), set()).add(source['hash'])
+    errors = {}
+    for index, file_search_result in enumerate(file_search_results):
+        abs_file_path = os.path.join(dest_dir, file_search_result['_source']['name'])
+        if len(hashes_by_path[abs_file_path]) > 1:
+            errors[index] = ValueError('Several files with different content would be downloaded to {}.'.format(
+                abs_file_path))
+    return errors
+
+
+def _has_ticket(params):
+    '''Returns whether request params hold a download ticket, or ask for one. Tickets are single use.'''
+    if params is None:
+        return False
+    if isinstance(params, basestring):
+        return 'ticket' in urlparse.parse_qs(params, keep_blank_values=True)
+    return 'ticket' in (params.keys() if hasattr(params, 'keys') else [name for name, _ in params])
+
+
+def _call_when_done(response, callback):
+    '''Calls `callback` once, when the body of a streamed response has been read or the response is closed.'''
+    lock = threading.Lock()
+    called = []
+
+    def _call_once():
+        with lock:
+            if called:
+                return
+            called.append(True)
+        callback()
+
+    iter_content, close = response.iter_content, response.close
+
+    def _iter_content(*args, **kwargs):
+        try:
+            for chunk in iter_content(*args, **kwargs):
+                yield chunk
+        finally:
+            _call_once()
+
+    def _close():
+        try:
+            close()
+        finally:
+            _call_once()
+
+    response.iter_content = _iter_content
+    response.close = _close
+
+
+def _find_files(dir):
+    # This will eventually recurse into directories, but for now we throw.
+    for basename in os.listdir(dir):
+        filename = os.path.join(dir, basename)
+        assert not os.path.islink(filename), '_find_files does not support symlinks'
+        if os.path.isdir(filename):
+            for f in _find_files(filename):
+                yield f
+        else:
+            yield filename
+
+
+class FileUploadResult(namedtuple('FileUploadResult', [
+        'name', 'kind', 'size', 'seconds', 'attempts', 'error'])):
+    '''Outcome of uploading one file with ScitranClient.upload_analysis_files.
+
+    `kind` is either 'input' or 'output', `size` is in bytes, `seconds` is the time spent
+    on the successful (or last) attempt, and `error` is None unless the upload failed.
+    '''
+
+    @property
+    def throughput(self):
+        '''Upload speed in bytes per second.'''
+        return self.size / self.seconds if self.seconds else None
 
 
 class ScitranClient(object):
@@ -58,6 +226,45 @@ class ScitranClient(object):
         instance_name (str): instance name or host.
         token (str): Authentication token.
         st_dir (str): The path to the directory where token and authentication file are kept for this instance.
+        hash_cache (HashCache): Cache of local file hashes, or None when hashes are always computed.
+            Pass `hash_cache=False` to the constructor to disable it, or a HashCache to use a custom location.
+        blob_store (BlobStore): Content-addressed store that downloads are shared through, or None.
+            Pass `blob_store=True` to the constructor to enable it in st_dir, or a BlobStore to use a custom
+            location or size budget.
+        search_cache (SearchCache): Cache of search results, or None. Pass `search_cache=True` to the
+            constructor to enable it in st_dir with a TTL of an hour, or a SearchCache to use a custom
+            location or TTL.
+        metrics (RequestMetrics): Latency, throughput and error metrics of the requests made by this client.
+            See `stats`.
+        http_cache (HTTPCache): Cache of GET responses that are revalidated with ETag/Last-Modified,
+            or None. Pass `http_cache=True` to the constructor to enable it.
+        single_flight (SingleFlight): Shares one request between threads that make the same GET request
+            at the same time, or None. Each caller gets its own copy of the response, so documents
+            decoded with `response.json()` are not shared. Requests for single use download tickets
+            are never shared. Pass `single_flight=False` to disable it.
+        rate_limiter (RateLimiter): Limits the rate and concurrency of searches, metadata requests and file
+            transfers, or None. Pass `rate_limiter=True` to the constructor to use the default limits.
+        download_chunk_size (int): Size of the chunks downloads are streamed to disk in. When None, the
+            chunk size is picked for each file based on its size.
+
+    A client can be shared by any number of threads. Every thread sends its requests with a
+    requests.Session of its own, as sessions are not guaranteed to be thread-safe, and all sessions
+    share the client's connection pool, caches, metrics and limits. Pass `thread_safe=False` to have
+    all threads use a single session instead.
+
+    The connection pool is set up by the `pool_connections` (number of hosts to keep connections
+    for), `pool_maxsize` (connections kept per host) and `pool_block` (wait for a free connection
+    rather than opening one that will not be kept) constructor arguments. When many threads share
+    a client, `pool_maxsize` should be at least the number of threads. See the README for how
+    throughput scales with the number of threads.
+
+    Failed requests are retried according to the `retry_policy` constructor argument, a RetryPolicy.
+    By default, idempotent requests are retried 3 times and a circuit breaker stops sending requests
+    to a server after 10 consecutive failures. Pass `retry_policy=None` to disable retries.
+
+    The API key in auth.json is not checked when the client is created. When a request is refused
+    with 401 Unauthorized, the key is validated and the user is asked for a new one if it is invalid,
+    after which the request is sent again.
     '''
 
     def __init__(self,
@@ -66,21 +273,79 @@ class ScitranClient(object):
                  st_dir=AUTH_DIR,
                  downloads_dir=DEFAULT_DOWNLOADS_DIR,
                  gear_in_dir=DEFAULT_INPUT_DIR,
-                 gear_out_dir=DEFAULT_OUTPUT_DIR):
-
-        self.session = requests.Session()
+                 gear_out_dir=DEFAULT_OUTPUT_DIR,
+                 hash_cache=True,
+                 blob_store=None,
+                 download_chunk_size=None,
+                 pool_connections=10,
+                 pool_maxsize=10,
+                 pool_block=False,
+                 retry_policy=True,
+                 search_cache=None,
+                 http_cache=None,
+                 single_flight=True,
+                 rate_limiter=None,
+                 thread_safe=True):
+
+        self.metrics = RequestMetrics()
+        self.debug = debug
+        self._adapter = CountingHTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        self._local = threading.local()
+        self._shared_session = None if thread_safe else self._new_session()
+        if retry_policy is True:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
         self.instance_name_or_host = instance_name
         self.st_dir = st_dir
+        self._auth_lock = threading.Lock()
+        self._token_revalidated = False
         self._authenticate()
-        self.debug = debug
         self.downloads_dir = downloads_dir
         self.gear_in_dir = gear_in_dir
         self.gear_out_dir = gear_out_dir
+        if hash_cache is True:
+            hash_cache = HashCache(os.path.join(self.st_dir, HASH_CACHE_FILENAME))
+        self.hash_cache = hash_cache or None
+        if blob_store is True:
+            blob_store = BlobStore(os.path.join(self.st_dir, BLOB_STORE_DIRNAME), DEFAULT_BLOB_STORE_MAX_BYTES)
+        self.blob_store = blob_store or None
+        self.download_chunk_size = download_chunk_size
+        self._download_lock = threading.Lock()
+        self._deduplicated_files = 0
+        self._deduplicated_bytes = 0
+        if search_cache is True:
+            search_cache = SearchCache(os.path.join(self.st_dir, SEARCH_CACHE_DIRNAME))
+        self.search_cache = search_cache or None
+        if http_cache is True:
+            http_cache = HTTPCache()
+        self.http_cache = http_cache or None
+        self.single_flight = SingleFlight() if single_flight else None
+        if rate_limiter is True:
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter or None
 
         self._set_up_dir_structure()
 
+    def _new_session(self):
+        session = requests.Session()
+        # every session sends its requests through the same adapter, and thus the same connection pool.
+        session.mount('https://', self._adapter)
+        session.mount('http://', self._adapter)
         if self.debug:
-            self.session.hooks = dict(response=self._print_request_info)
+            session.hooks = dict(response=self._print_request_info)
+        return session
+
+    @property
+    def session(self):
+        '''The requests.Session of the calling thread, or the session shared by all threads when the
+        client was created with `thread_safe=False`.'''
+        if self._shared_session is not None:
+            return self._shared_session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._new_session()
+        return session
 
     def _set_up_dir_structure(self):
         if not os.path.isdir(self.downloads_dir):
@@ -90,11 +355,30 @@ class ScitranClient(object):
         if not os.path.isdir(self.gear_out_dir):
             os.mkdir(self.gear_out_dir)
 
+    def connection_stats(self):
+        '''Returns how many requests were sent over a reused connection and how many opened a new one.
+
+        Returns:
+            dict: with keys `requests`, `new_connections` and `reused_connections`.
+        '''
+        return self._adapter.counters.as_dict()
+
+    def retry_stats(self):
+        '''Returns the number of retries, the seconds spent waiting for them and the circuit breaker state.'''
+        return self.retry_policy.stats() if self.retry_policy else {}
+
+    def download_stats(self):
+        '''Returns how many files `download_all_file_search_results` linked to a download of the same
+        content instead of downloading them, and the bytes that were not transferred because of it.'''
+        with self._download_lock:
+            return dict(deduplicated_files=self._deduplicated_files, deduplicated_bytes=self._deduplicated_bytes)
+
     def _check_status_code(self, response):
         '''Checks the status codes of received responses and raises errors in case of bad http requests.'''
         status_code = response.status_code
 
-        if status_code == 200:
+        # 206 is sent in response to Range requests when resuming downloads.
+        if status_code in (200, 206):
             return
 
         exceptions_dict = {
@@ -137,9 +421,28 @@ class ScitranClient(object):
         request.headers.update({'Authorization': 'scitran-user ' + self.token})
         return request
 
-    def _authenticate(self):
-        self.token, self.base_url = st_auth.create_token(self.instance_name_or_host, self.st_dir)
-        self.base_url = urlparse.urljoin(self.base_url, 'api/')
+    def _authenticate(self, validate=False):
+        # The key is not checked up front; a request refused with 401 triggers the check instead.
+        token, url = st_auth.create_token(
+            self.instance_name_or_host, self.st_dir, validate=validate, ttl=0, session=self.session)
+        # other threads may be sending requests, so attributes are only assigned their final values.
+        self.token, self.base_url = token, urlparse.urljoin(url, 'api/')
+
+    def _revalidate_token(self, response):
+        '''Handles a request that was refused with 401 and returns whether it should be sent again.
+
+        The first time, the API key is checked with the server and a new one is asked for when it is
+        invalid. Later 401 responses are errors, unless the key was replaced after the request was sent.
+        '''
+        with self._auth_lock:
+            if response.request.headers.get('Authorization') != 'scitran-user ' + self.token:
+                return True
+            if self._token_revalidated:
+                return False
+            self._token_revalidated = True
+            log.info('Request was not authorized, validating the API key.')
+            self._authenticate(validate=True)
+            return True
 
     def _request(self, *args, **kwargs):
         '''This function is deprecated.
@@ -149,7 +452,7 @@ class ScitranClient(object):
     def request(
         self, endpoint, method='GET',
         params=None, data=None, json=None,
-        headers=None, files=None
+        headers=None, files=None, stream=False
     ):
         '''Dispatches requests, taking care of the instance-specific base_url and authentication.
         Also raises appropriate HTTP errors.
@@ -164,23 +467,161 @@ class ScitranClient(object):
             files: description of files to be uploaded by the requests library.
                 See the requests library docs for more details:
                 http://docs.python-requests.org/en/master/user/quickstart/#post-a-multipart-encoded-file
+            stream (bool): When true, the response body is not downloaded until it is accessed,
+                for example through `response.iter_content`.
 
         Returns:
             The full server response.
         '''
-        response = self.session.request(url=self._url(endpoint),
-                                        method=method,
-                                        params=params,
-                                        data=data,
-                                        json=json,
-                                        headers=headers,
-                                        auth=self._authenticate_request,
-                                        files=files)
+        url = self._url(endpoint)
+        if self.single_flight and method.upper() == 'GET' and not stream and not _has_ticket(params):
+            key = (url, params_key(params), repr(sorted((headers or {}).items())))
+            response = self.single_flight.do(key, lambda: self._send_request(
+                url, endpoint, method, params, data, json, headers, files, stream))
+            # callers share the body, but get their own copy of the response to change attributes of.
+            return copy.copy(response)
+        return self._send_request(url, endpoint, method, params, data, json, headers, files, stream)
+
+    def _send_request(self, url, endpoint, method, params, data, json, headers, files, stream):
+        request_headers = headers
+
+        # Only whole GET responses are cached, streamed ones are typically too big to keep in memory.
+        # Download tickets are single use, so they must never come from the cache.
+        cache_key = cached = None
+        if self.http_cache and method.upper() == 'GET' and not stream and not _has_ticket(params):
+            cache_key = self.http_cache.key(url, params)
+            cached = self.http_cache.get(cache_key)
+            if cached is not None:
+                headers = dict(self.http_cache.conditional_headers(cached), **(headers or {}))
+
+        start = time.time()
+        response = None
+        try:
+            response = self._send_with_retries(
+                rate_class=endpoint_class(endpoint),
+                url=url,
+                method=method,
+                params=params,
+                data=data,
+                json=json,
+                headers=headers,
+                auth=self._authenticate_request,
+                files=files,
+                stream=stream)
+        finally:
+            self._record_request(method, endpoint, time.time() - start, response)
+
+        # bodies that are read while they are sent, like MultipartEncoder, can not be sent again.
+        if response.status_code == 401 and self._revalidate_token(response) and not hasattr(data, 'read'):
+            response.close()
+            return self._send_request(url, endpoint, method, params, data, json, request_headers, files, stream)
+
+        if cache_key is not None:
+            response = self.http_cache.update(cache_key, cached, response)
 
         self._check_status_code(response)
         return response
 
-    def search(self, constraints, num_results=-1):
+    def _record_request(self, method, endpoint, seconds, response):
+        '''Adds a request to the client's metrics. `response` is None when no response was received.'''
+        if response is None:
+            self.metrics.record(method, endpoint, seconds, error=True)
+            return
+        if response.raw is None or response._content_consumed:
+            bytes_in = len(response.content or b'')
+        else:
+            # the body of streamed responses has not been read yet.
+            bytes_in = int(response.headers.get('Content-Length') or 0)
+        body = response.request.body
+        bytes_out = len(body) if body is not None and hasattr(body, '__len__') else 0
+        self.metrics.record(
+            method, endpoint, seconds, bytes_in=bytes_in, bytes_out=bytes_out,
+            error=response.status_code >= 400)
+
+    def stats(self):
+        '''Returns performance metrics of this client.
+
+        `endpoints` has request counts, latency percentiles (p50, p95 and p99, in seconds), bytes
+        received and sent and error counts for every method and endpoint template, like
+        "GET sessions/{id}/analyses". The other keys hold the statistics of the connection pool,
+        the retry policy, the deduplication of downloads, the caches, the rate limiter (how long
+        requests waited for their turn) and of `single_flight`, whose `collapsed` count is the number
+        of requests that shared the response of an identical request in flight. The result can be
+        serialized with `json.dumps`; use `client.metrics.to_prometheus()` for the Prometheus text
+        format of the endpoint metrics.
+        '''
+        return dict(
+            endpoints=self.metrics.as_dict(),
+            connections=self.connection_stats(),
+            retries=self.retry_stats(),
+            downloads=self.download_stats(),
+            http_cache=self.http_cache.stats() if self.http_cache else None,
+            search_cache=self.search_cache.stats() if self.search_cache else None,
+            single_flight=self.single_flight.stats() if self.single_flight else None,
+            rate_limiter=self.rate_limiter.stats() if self.rate_limiter else None,
+        )
+
+    def _send(self, rate_class, kwargs):
+        '''Sends a request with the session once the rate limiter lets it through.'''
+        if not self.rate_limiter:
+            return self.session.request(**kwargs)
+        if not kwargs.get('stream'):
+            with self.rate_limiter.limit(rate_class):
+                return self.session.request(**kwargs)
+
+        # the body of a streamed response is transferred while it is read, so its slot is held until then.
+        self.rate_limiter.acquire(rate_class)
+        try:
+            response = self.session.request(**kwargs)
+        except Exception:
+            self.rate_limiter.release(rate_class)
+            raise
+        _call_when_done(response, lambda: self.rate_limiter.release(rate_class))
+        return response
+
+    def _send_with_retries(self, rate_class=None, **kwargs):
+        '''Sends a request with the session, retrying it as allowed by the retry policy.'''
+        method = kwargs['method']
+        policy = self.retry_policy
+        if not policy:
+            return self._send(rate_class, kwargs)
+        breaker = policy.circuit_breaker
+
+        retry = 0
+        while True:
+            if breaker:
+                breaker.before_request()
+            try:
+                response = self._send(rate_class, kwargs)
+            except requests.exceptions.ConnectionError as e:
+                if breaker:
+                    breaker.record_failure()
+                retry += 1
+                if not policy.should_retry(method, retry):
+                    raise
+                log.info('{} {} failed ({}), retrying.'.format(method, kwargs['url'], e))
+                policy.wait(retry)
+                continue
+            except Exception:
+                if breaker:
+                    breaker.record_failure()
+                raise
+
+            if response.status_code not in policy.status_codes:
+                if breaker:
+                    breaker.record_success()
+                return response
+
+            if breaker:
+                breaker.record_failure()
+            retry += 1
+            if not policy.should_retry(method, retry):
+                return response
+            log.info('{} {} responded with {}, retrying.'.format(method, kwargs['url'], response.status_code))
+            response.close()
+            policy.wait(retry, response)
+
+    def search(self, constraints, num_results=-1, fields=None, use_cache=True):
         '''Searches given constraints (which supplies a path).
 
         This is the most general function for an elastic search that allows to pass in a "path" as well as
@@ -189,6 +630,12 @@ class ScitranClient(object):
         Args:
             constraints (dict): The constraints of the search, i.e.
                 {'collections':{'should':[{'match':...}, ...]}, 'sessions':{'should':[{'match':...}, ...]}}
+            fields (list or dict, optional): Fields of `_source` to return for each result, which can
+                make responses much smaller. Either a list of fields to include or a dict with
+                `includes` and/or `excludes` lists. Wildcards like `acquisition.*` are allowed.
+                Overrides a `_source` set with `query(...).source(...)`.
+            use_cache (bool, optional): When false, the search cache of the client is bypassed and
+                the results are fetched from the server (and stored in the cache).
 
         Returns:
             python dict of search results.
@@ -199,13 +646,27 @@ class ScitranClient(object):
 
         if num_results != -1:
             search_body.update({'size': num_results})
+        if fields is not None:
+            search_body['_source'] = fields
+
+        cache_key = None
+        if self.search_cache:
+            # results depend on the permissions of the user, so the token is part of the key.
+            cache_key = canonical_search_key(search_body, num_results, self.base_url, self.token)
+            if use_cache:
+                results = self.search_cache.get(cache_key)
+                if results is not None:
+                    return results
 
         response = self.request(
             endpoint='search', method='POST', json=search_body, params={'size': num_results})
 
         # ensure we get the last path part to make this work for `analyses/files` queries
         last_path_part = path.split('/')[-1]
-        return response.json()[last_path_part]
+        results = response.json()[last_path_part]
+        if cache_key:
+            self.search_cache.put(cache_key, results)
+        return results
 
     def search_files(self, constraints, **kwargs):
         return self.search(dict(constraints, path='files'), **kwargs)
@@ -222,18 +683,134 @@ class ScitranClient(object):
     def search_acquisitions(self, constraints, **kwargs):
         return self.search(dict(constraints, path='acquisitions'), **kwargs)
 
+    def iter_search(self, constraints, page_size=1000, sort=None, fields=None, search_after=False):
+        '''Searches given constraints like `search`, but yields the results one page at a time.
+
+        Results are decoded while they are received, one at a time, and the first results are
+        available as soon as the first page starts arriving. Pages are requested by offset (`from`).
+        With `search_after=True`, they are requested with a `search_after` cursor built from the
+        `sort` values of the last hit of the previous page instead, which stays fast for deep pages
+        but needs Elasticsearch 5.0 or later. When the server does not return sort values, pages
+        are requested by offset either way.
+
+        Args:
+            constraints (dict): The constraints of the search, see `search`.
+            page_size (int): Number of results requested per page.
+            sort (list, optional): Elasticsearch sort clause. Results must have a stable order for
+                paging, so this defaults to sorting by `_uid`.
+            fields (list or dict, optional): Fields of `_source` to return for each result, see `search`.
+            search_after (bool, optional): Whether to page with `search_after` cursors.
+
+        Returns:
+            generator of search results.
+
+        Raises:
+            st_exceptions.PagingError: When a page starts with the same result as the previous one,
+                as the search would otherwise repeat that page forever.
+        '''
+        assert 'path' in constraints, 'must supply path in constraints'
+        last_path_part = constraints['path'].split('/')[-1]
+        search_body = dict(constraints, size=page_size, sort=sort or [{'_uid': 'asc'}])
+        if fields is not None:
+            search_body['_source'] = fields
+
+        offset = 0
+        previous_first_id = None
+        while True:
+            count = 0
+            last_hit = None
+            for hit in self._stream_search_hits(search_body, page_size, last_path_part):
+                if not count:
+                    first_id = (hit.get('_index'), hit.get('_type'), hit.get('_id'))
+                    if offset and hit.get('_id') is not None and first_id == previous_first_id:
+                        raise st_exceptions.PagingError(
+                            'The page at offset {} starts with the same result ({}) as the previous page.'.format(
+                                offset, hit['_id']))
+                    previous_first_id = first_id
+                count += 1
+                last_hit = hit
+                yield hit
+            if count < page_size:
+                return
+
+            offset += count
+            if search_after and 'sort' in last_hit:
+                search_body['search_after'] = last_hit['sort']
+            else:
+                search_body['from'] = offset
+
+    def stream_search(self, constraints, num_results=-1, fields=None):
+        '''Searches given constraints like `search`, but decodes the response while it is received.
+
+        Results are yielded one at a time as soon as they have been read from the response, so
+        memory use is proportional to a single result instead of the whole result set.
+
+        Args:
+            constraints (dict): The constraints of the search, see `search`.
+            fields (list or dict, optional): Fields of `_source` to return for each result, see `search`.
+
+        Returns:
+            generator of search results.
+        '''
+        assert 'path' in constraints, 'must supply path in constraints'
+        search_body = constraints.copy()
+        if num_results != -1:
+            search_body.update({'size': num_results})
+        if fields is not None:
+            search_body['_source'] = fields
+        return self._stream_search_hits(search_body, num_results, constraints['path'].split('/')[-1])
+
+    def _stream_search_hits(self, search_body, size, last_path_part):
+        response = self.request(
+            endpoint='search', method='POST', json=search_body, params={'size': size}, stream=True)
+        try:
+            for hit in iter_object_array(response.iter_content(64 * 1024), last_path_part):
+                yield hit
+        finally:
+            response.close()
+
+    def _compute_file_hash(self, abs_file_path):
+        '''Computes the hash of a local file, using the hash cache when possible.'''
+        if not self.hash_cache:
+            return compute_file_hash(abs_file_path)
+        file_hash = self.hash_cache.get(abs_file_path)
+        if file_hash is None:
+            file_hash = compute_file_hash(abs_file_path)
+            self.hash_cache.put(abs_file_path, file_hash)
+        return file_hash
+
+    def _remember_hash(self, abs_file_path, file_hash):
+        '''Records the hash of a file we have just verified in the hash cache.'''
+        if not self.hash_cache:
+            return
+        try:
+            self.hash_cache.put(abs_file_path, file_hash)
+        except OSError as e:
+            # blob store files can be evicted by other processes at any time.
+            if e.errno != errno.ENOENT:
+                raise
+
     def _file_matches_hash(self, abs_file_path, file_hash):
         assert file_hash.startswith(HASH_PREFIX)
-        return compute_file_hash(abs_file_path) == file_hash
+        return self._compute_file_hash(abs_file_path) == file_hash
 
     def download_file(
         self, container_type, container_id,
         file_name, file_hash,
         dest_dir=None, analysis_id=None,
-        tqdm_kwargs=None, tqdm_disable=False
+        tqdm_kwargs=None, tqdm_disable=False,
+        max_resumes=3
     ):
         '''Download a file that resides in a specified container.
 
+        The file is first written to `<file_name>.part` while its hash is computed from the received
+        chunks, and it is only moved into place when that hash matches `file_hash`. When a transfer is
+        interrupted, the partial file is kept and the download is resumed with an HTTP Range request,
+        both immediately (up to `max_resumes` times) and by later calls. Servers that ignore the Range
+        header cause a full download. When a resumed download has incorrect content, for instance
+        because the partial file was left over from another version of the file, it is restarted
+        once from the beginning.
+
         Args:
             container_type (str): The type of container the file resides in (i.e. acquisition, session...)
             container_id (str): The elasticsearch id of the specific container the file resides in.
@@ -242,6 +819,7 @@ class ScitranClient(object):
             analysis_id (str, optional): ID of analysis that file is from.
             tqdm_kwargs (dict, optional): kwargs to pass to tqdm progress bar.
             tqdm_disable (bool, optional): if true, tqdm will not wrap response download
+            max_resumes (int, optional): Number of times an interrupted transfer is resumed before giving up.
 
         Returns:
             string. The absolute file path to the downloaded acquisition.
@@ -261,121 +839,485 @@ class ScitranClient(object):
             ['files', file_name]
         )
         abs_file_path = os.path.join(dest_dir, file_name)
+        part_file_path = abs_file_path + '.part'
+
+        if self._use_local_copy(abs_file_path, file_hash):
+            return abs_file_path
+
+        def _request_file(headers):
+            if analysis_id:
+                # tickets are single use, so every attempt needs a new one.
+                ticket_response = self.request(
+                    endpoint=endpoint, params=dict(ticket='')
+                ).json()
+                return self.request(
+                    endpoint=endpoint, params=dict(ticket=ticket_response['ticket']),
+                    headers=headers, stream=True)
+            return self.request(endpoint=endpoint, headers=headers, stream=True)
+
+        desc = tqdm_kwargs.pop('desc', file_name)
+        leave = tqdm_kwargs.pop('leave', False)
+        resumes = 0
+        # whether the content received so far continues a partial file, which might be left over
+        # from another version of the file.
+        resumed = False
+        restarted = False
+        # sha384 of the bytes in the partial file, kept across resumed attempts.
+        h = None
+        hashed_size = 0
+        while True:
+            offset = os.path.getsize(part_file_path) if os.path.exists(part_file_path) else 0
+            headers = {'Range': 'bytes={}-'.format(offset)} if offset else None
+            try:
+                response = _request_file(headers)
+            except st_exceptions.APIException as e:
+                # 416 means our partial file does not fit the file on the server anymore.
+                if offset and e.response.status_code == 416:
+                    os.remove(part_file_path)
+                    continue
+                raise
+
+            if response.status_code == 206:
+                if _content_range_start(response) != offset:
+                    log.info('Server resumed {} at an unexpected offset, restarting download.'.format(file_name))
+                    response.close()
+                    os.remove(part_file_path)
+                    continue
+                resumed = True
+            else:
+                # The server ignored our Range header and is sending the whole file.
+                offset = 0
+                resumed = False
+
+            if h is None or hashed_size != offset:
+                h = hashlib.new('sha384')
+                if offset:
+                    _update_hash(h, part_file_path)
+                hashed_size = offset
+
+            content_length = response.headers.get('Content-Length')
+            content_length = int(content_length) if content_length else None
+            chunk_size = self.download_chunk_size or _adaptive_chunk_size(content_length)
+            progress = tqdm(
+                desc=desc, leave=leave,
+                total=offset + content_length if content_length is not None else None,
+                initial=offset, unit='B', unit_scale=True,
+                disable=tqdm_disable,
+                **tqdm_kwargs
+            )
+            try:
+                with open(part_file_path, 'ab' if offset else 'wb') as fd:
+                    for chunk in response.iter_content(chunk_size):
+                        fd.write(chunk)
+                        h.update(chunk)
+                        hashed_size += len(chunk)
+                        progress.update(len(chunk))
+                if resumed and not restarted and HASH_PREFIX + h.hexdigest() != file_hash:
+                    log.warning('Resumed download of {} has incorrect content, restarting it.'.format(file_name))
+                    os.remove(part_file_path)
+                    resumed = False
+                    restarted = True
+                    continue
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                if resumes >= max_resumes:
+                    raise
+                resumes += 1
+                log.warning('Download of {} was interrupted ({}), resuming.'.format(file_name, e))
+            finally:
+                progress.close()
+                response.close()
+
+        self._finish_download(part_file_path, abs_file_path, file_hash, HASH_PREFIX + h.hexdigest())
+        return abs_file_path
 
+    def _use_local_copy(self, abs_file_path, file_hash):
+        '''Returns whether `abs_file_path` already has the content of `file_hash`, linking it from the
+        blob store when it is there.'''
+        file_name = os.path.basename(abs_file_path)
         if os.path.exists(abs_file_path):
             if self._file_matches_hash(abs_file_path, file_hash):
                 log.info('Found local copy of {} with correct content.'.format(file_name))
-                return abs_file_path
+                return True
+
+        if self.blob_store:
+            blob_path = self.blob_store.get(file_hash)
+            if blob_path and not self._file_matches_hash(blob_path, file_hash):
+                log.warning('Blob store copy of {} has incorrect content, discarding it.'.format(file_name))
+                self.blob_store.discard(file_hash)
+            elif blob_path and self.blob_store.link(file_hash, abs_file_path):
+                log.info('Found {} in blob store.'.format(file_name))
+                self._remember_hash(abs_file_path, file_hash)
+                return True
+        return False
+
+    def _finish_download(self, part_file_path, abs_file_path, file_hash, received_hash):
+        '''Moves a downloaded file into place when the hash of the received content is `file_hash`.'''
+        if received_hash != file_hash:
+            os.remove(part_file_path)
+            raise Exception('Downloaded file {} has incorrect hash. Should be {}'.format(abs_file_path, file_hash))
 
-        if analysis_id:
-            ticket_response = self.request(
-                endpoint=endpoint, params=dict(ticket='')
-            ).json()
-            response = self.request(endpoint=endpoint, params=dict(ticket=ticket_response['ticket']))
-        else:
-            response = self.request(endpoint=endpoint)
+        os.rename(part_file_path, abs_file_path)
+        self._remember_hash(abs_file_path, file_hash)
+        if self.blob_store:
+            self._remember_hash(self.blob_store.add(file_hash, abs_file_path), file_hash)
 
-        desc = tqdm_kwargs.pop('desc', file_name)
-        leave = tqdm_kwargs.pop('leave', False)
-        with open(abs_file_path, 'wb') as fd:
-            content = response.iter_content(4096)
-            if not tqdm_disable:
-                content = tqdm(
-                    content,
-                    desc=desc, leave=leave,
-                    unit=' 4KB',
-                    **tqdm_kwargs
-                )
-            for chunk in content:
-                fd.write(chunk)
+    def download_all_file_search_results(self, file_search_results, dest_dir=None, max_workers=1):
+        '''Download all files contained in the list returned by a call to ScitranClient.search_files()
 
-        if not self._file_matches_hash(abs_file_path, file_hash):
-            raise Exception('Downloaded file {} has incorrect hash. Should be {}'.format(abs_file_path, file_hash))
+        Only the fields in FILE_DOWNLOAD_FIELDS are used, so searches for files to download can
+        be made with `fields=FILE_DOWNLOAD_FIELDS` to keep their results small.
 
-        return abs_file_path
+        Files are downloaded by a pool of `max_workers` threads. A failed download does not stop the
+        others; errors are collected and raised together once every file has been attempted. Results
+        that would be downloaded to the same path as a result with different content, like `dwi.bval`
+        of two acquisitions, are not downloaded and count as errors; download them to separate
+        directories instead.
 
-    def download_all_file_search_results(self, file_search_results, dest_dir=None):
-        '''Download all files contained in the list returned by a call to ScitranClient.search_files()
+        Results with the same hash, like inputs copied to several acquisitions, are downloaded once
+        and the other files are hardlinked to that download (or copied, when hardlinks are not
+        possible). Hardlinked files share their content, so they should be treated as read-only.
+        The bytes this avoided transferring are logged and counted in `download_stats`.
 
         Args:
             file_search_results (dict): Search result.
             dest_dir (str): Path to the directory that files should be downloaded to.
+            max_workers (int, optional): Number of files that are downloaded at the same time.
 
         Returns:
-            string: Destination directory.
+            list: Absolute paths of the downloaded files, in the same order as `file_search_results`.
+
+        Raises:
+            st_exceptions.DownloadError: When at least one file could not be downloaded.
         '''
-        file_paths = []
-        for file_search_result in tqdm(file_search_results):
-            container_id = file_search_result['_source']['acquisition']['_id']
-            container_name = file_search_result['_source']['container_name']
-            file_name = file_search_result['_source']['name']
-            file_hash = file_search_result['_source']['hash']
-            abs_file_path = self.download_file(container_name, container_id, file_name, file_hash, dest_dir=dest_dir)
-            file_paths.append(abs_file_path)
+        if not dest_dir:
+            dest_dir = self.gear_in_dir
+
+        def _download(file_search_result):
+            source = file_search_result['_source']
+            return self.download_file(
+                source['container_name'], source['acquisition']['_id'],
+                source['name'], source['hash'],
+                dest_dir=dest_dir,
+                # per-file progress bars would garble each other when downloading concurrently.
+                tqdm_disable=max_workers > 1)
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        file_paths = [None] * len(file_search_results)
+        errors = _colliding_destinations(file_search_results, dest_dir)
+        for index, e in sorted(errors.items()):
+            log.warning('Not downloading {}: {}'.format(file_search_results[index]['_source']['name'], e))
+
+        # hash -> indices of the search results with that content. Only the first one is downloaded.
+        indices_by_hash = OrderedDict()
+        for index, file_search_result in enumerate(file_search_results):
+            if index not in errors:
+                indices_by_hash.setdefault(file_search_result['_source']['hash'], []).append(index)
+
+        deduplicated_files = deduplicated_bytes = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_download, file_search_results[indices[0]]): (file_hash, indices)
+                for file_hash, indices in indices_by_hash.items()
+            }
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                file_hash, indices = futures[future]
+                try:
+                    file_paths[indices[0]] = future.result()
+                except Exception as e:
+                    log.warning('Could not download {}: {}'.format(
+                        file_search_results[indices[0]]['_source']['name'], e))
+                    errors.update((index, e) for index in indices)
+                    continue
+
+                if len(indices) > 1 and not self._file_matches_hash(file_paths[indices[0]], file_hash):
+                    # the download was changed since it was verified, so it can not be linked to.
+                    e = Exception('{} does not have the content {} anymore.'.format(file_paths[indices[0]], file_hash))
+                    log.warning('Could not link duplicates of {}: {}'.format(file_paths[indices[0]], e))
+                    errors.update((index, e) for index in indices[1:])
+                    continue
+
+                for index in indices[1:]:
+                    source = file_search_results[index]['_source']
+                    abs_file_path = os.path.join(dest_dir, source['name'])
+                    try:
+                        if self._link_duplicate(file_paths[indices[0]], abs_file_path, file_hash):
+                            deduplicated_files += 1
+                            deduplicated_bytes += source.get('size', 0)
+                        file_paths[index] = abs_file_path
+                    except (IOError, OSError) as e:
+                        log.warning('Could not link {}: {}'.format(source['name'], e))
+                        errors[index] = e
+
+        if deduplicated_files:
+            log.info('Linked {} files to downloads of the same content, avoiding the transfer of {} bytes.'.format(
+                deduplicated_files, deduplicated_bytes))
+            with self._download_lock:
+                self._deduplicated_files += deduplicated_files
+                self._deduplicated_bytes += deduplicated_bytes
+
+        if errors:
+            raise st_exceptions.DownloadError(file_paths, errors)
 
         return file_paths
 
-    def upload_analysis(self, in_dir, out_dir, metadata, target_collection_id):
+    def _link_duplicate(self, src_path, abs_file_path, file_hash):
+        '''Places a hardlink to (or a copy of) `src_path` at `abs_file_path`, unless it already is one.
+        Returns whether a file was placed.'''
+        if os.path.exists(abs_file_path) and os.path.samefile(src_path, abs_file_path):
+            return False
+        _link_or_copy(src_path, abs_file_path)
+        self._remember_hash(abs_file_path, file_hash)
+        return True
+
+    def download_archive(self, file_search_results, dest_dir=None, tqdm_kwargs=None, tqdm_disable=False):
+        '''Downloads the files of a file search in a single request, as a tar archive.
+
+        A download ticket is requested for all files at once, and the archive the server sends for it
+        is extracted while it is received, so no archive is written to disk. Every file is written to
+        `<name>.part` while its hash is computed, and only moved into place when that hash matches the
+        one in its search result. Files that are already in `dest_dir` or in the blob store with the
+        right content are not requested, and neither are results that would be written to the same
+        path as a result with different content. Archive members are only written to the paths of
+        the requested files, so an archive can not place files anywhere else.
+
+        Args:
+            file_search_results (list): Results of a file search, see download_all_file_search_results.
+            dest_dir (str): Path to the directory that files should be downloaded to.
+            tqdm_kwargs (dict, optional): kwargs to pass to tqdm progress bar.
+            tqdm_disable (bool, optional): if true, no progress bar is shown for the download.
+
+        Returns:
+            list: Absolute paths of the downloaded files, in the same order as `file_search_results`.
+
+        Raises:
+            st_exceptions.DownloadError: When at least one file was missing from the archive or had
+                incorrect content.
+        '''
+        import tarfile
+
+        if not dest_dir:
+            dest_dir = self.gear_in_dir
+        real_dest_dir = os.path.realpath(dest_dir)
+
+        file_paths = [None] * len(file_search_results)
+        errors = _colliding_destinations(file_search_results, dest_dir)
+        # archive member name -> indices of the search results it is the content of.
+        wanted = {}
+        for index, file_search_result in enumerate(file_search_results):
+            source = file_search_result['_source']
+            abs_file_path = os.path.join(dest_dir, source['name'])
+            if index in errors:
+                continue
+            elif os.path.dirname(os.path.realpath(abs_file_path)) != real_dest_dir:
+                errors[index] = ValueError('File name {!r} is not a plain file name.'.format(source['name']))
+            elif self._use_local_copy(abs_file_path, source['hash']):
+                file_paths[index] = abs_file_path
+            else:
+                member_name = '{}/{}/{}'.format(source['container_name'], source['acquisition']['_id'], source['name'])
+                wanted.setdefault(member_name, []).append(index)
+
+        if wanted:
+            ticket = self.request('download', method='POST', params=dict(bulk='true'), json=dict(files=[
+                dict(container_name=container_name, container_id=container_id, filename=filename)
+                for container_name, container_id, filename in (name.split('/', 2) for name in sorted(wanted))
+            ])).json()['ticket']
+            response = self.request('download', params=dict(ticket=ticket), stream=True)
+
+            tqdm_kwargs = dict(tqdm_kwargs or {})
+            progress = tqdm(
+                desc=tqdm_kwargs.pop('desc', 'downloading archive'),
+                leave=tqdm_kwargs.pop('leave', False),
+                total=sum(file_search_results[indices[0]]['_source'].get('size', 0) for indices in wanted.values()),
+                unit='B', unit_scale=True,
+                disable=tqdm_disable,
+                **tqdm_kwargs
+            )
+            # the body might be compressed for transfer; tarfile needs the archive itself.
+            response.raw.decode_content = True
+            try:
+                with tarfile.open(fileobj=response.raw, mode='r|*') as archive:
+                    for member in archive:
+                        if not member.isfile() or member.name not in wanted:
+                            log.info('Skipping unexpected archive member {}.'.format(member.name))
+                            continue
+                        indices = wanted.pop(member.name)
+                        source = file_search_results[indices[0]]['_source']
+                        abs_file_path = os.path.join(dest_dir, source['name'])
+                        try:
+                            self._extract_archive_member(archive, member, abs_file_path, source['hash'], progress)
+                        except Exception as e:
+                            log.warning('Could not download {}: {}'.format(source['name'], e))
+                            errors.update((index, e) for index in indices)
+                        else:
+                            for index in indices:
+                                file_paths[index] = abs_file_path
+            finally:
+                progress.close()
+                response.close()
+
+            for indices in wanted.values():
+                for index in indices:
+                    errors[index] = Exception('{} was missing from the archive.'.format(
+                        file_search_results[index]['_source']['name']))
+
+        if errors:
+            raise st_exceptions.DownloadError(file_paths, errors)
+
+        return file_paths
+
+    def _extract_archive_member(self, archive, member, abs_file_path, file_hash, progress):
+        '''Writes an archive member to `abs_file_path` when its content has the hash `file_hash`.'''
+        part_file_path = abs_file_path + '.part'
+        h = hashlib.new('sha384')
+        member_file = archive.extractfile(member)
+        chunk_size = self.download_chunk_size or _adaptive_chunk_size(member.size)
+        with open(part_file_path, 'wb') as fd:
+            for chunk in iter(lambda: member_file.read(chunk_size), b''):
+                fd.write(chunk)
+                h.update(chunk)
+                progress.update(len(chunk))
+        self._finish_download(part_file_path, abs_file_path, file_hash, HASH_PREFIX + h.hexdigest())
+
+    def upload_analysis(
+        self, in_dir, out_dir, metadata, target_collection_id,
+        tqdm_kwargs=None, tqdm_disable=False
+    ):
         '''Attaches an input file and an output file to a collection on the remote end.
 
+        The request body is streamed from disk, so memory use does not grow with the size of the files.
+
         Args:
             in_dir (str): The path to the directory with input files.
             out_dir (str): The path to the directory with output files.
             metadata (dict): A dictionary with metadata.
             target_collection_id (str): The id of the collection the file will be attached to.
+            tqdm_kwargs (dict, optional): kwargs to pass to tqdm progress bar.
+            tqdm_disable (bool, optional): if true, no progress bar is shown for the upload.
 
         Returns:
             requests Request object of the POST request.
         '''
 
-        def _find_files(dir):
-            # This will eventually recurse into directories, but for now we throw.
-            for basename in os.listdir(dir):
-                filename = os.path.join(dir, basename)
-                assert not os.path.islink(filename), '_find_files does not support symlinks'
-                if os.path.isdir(filename):
-                    for f in _find_files(filename):
-                        yield f
-                else:
-                    yield filename
-
         metadata['inputs'] = []
         metadata['outputs'] = []
-        multipart_data = []
-        filehandles = []
+        multipart_files = []
 
         def _add_file_to_request(filename, dir, metadata_value):
             relative = os.path.relpath(filename, dir)
-            fh = open(filename, 'rb')
-            filehandles.append(fh)
             metadata_value.append({'name': relative})
-            key = 'file{}'.format(len(multipart_data) + 1)
-            multipart_data.append((key, (relative, fh)))
+            key = 'file{}'.format(len(multipart_files) + 1)
+            multipart_files.append((key, relative, filename))
 
         endpoint = 'sessions/{}/analyses'.format(target_collection_id)
 
+        for filename in _find_files(in_dir):
+            _add_file_to_request(filename, in_dir, metadata['inputs'])
+        for filename in _find_files(out_dir):
+            _add_file_to_request(filename, out_dir, metadata['outputs'])
+
+        uploaded = [0]
+
+        def _update_progress(bytes_read, total):
+            progress.update(bytes_read - uploaded[0])
+            uploaded[0] = bytes_read
+
+        body = MultipartEncoder(
+            [('metadata', json.dumps(metadata))], multipart_files, callback=_update_progress)
+        tqdm_kwargs = dict(tqdm_kwargs or {})
+        progress = tqdm(
+            desc=tqdm_kwargs.pop('desc', 'uploading analysis'),
+            leave=tqdm_kwargs.pop('leave', False),
+            total=len(body), unit='B', unit_scale=True,
+            disable=tqdm_disable,
+            **tqdm_kwargs
+        )
+
         try:
-            for filename in _find_files(in_dir):
-                _add_file_to_request(filename, in_dir, metadata['inputs'])
-            for filename in _find_files(out_dir):
-                _add_file_to_request(filename, out_dir, metadata['outputs'])
             response = self.request(
                 endpoint, method='POST',
-                data={'metadata': json.dumps(metadata)}, files=multipart_data)
+                data=body, headers={'Content-Type': body.content_type})
         finally:
-            error = None
-            for fh in filehandles:
-                try:
-                    fh.close()
-                except Exception as e:
-                    if not error:
-                        error = e
-            # We only throw the first error, but we make sure that we close files before we throw.
-            if error:
-                raise error
+            body.close()
+            progress.close()
 
         return response
 
+    def upload_analysis_files(
+        self, in_dir, out_dir, metadata, target_collection_id,
+        max_workers=4, max_attempts=3
+    ):
+        '''Creates an analysis on a session and then uploads its input and output files one by one.
+
+        Unlike upload_analysis, which sends all files in a single request, files are uploaded
+        concurrently by `max_workers` threads and every file is retried on its own, so a failure
+        only requires that file to be sent again.
+
+        Args:
+            in_dir (str): The path to the directory with input files.
+            out_dir (str): The path to the directory with output files.
+            metadata (dict): A dictionary with metadata.
+            target_collection_id (str): The id of the session the analysis will be attached to.
+            max_workers (int, optional): Number of files that are uploaded at the same time.
+            max_attempts (int, optional): Number of times the upload of a file is attempted.
+
+        Returns:
+            tuple: (analysis id, list of FileUploadResult in the order files were found)
+
+        Raises:
+            st_exceptions.UploadError: When at least one file could not be uploaded.
+        '''
+        analysis_endpoint = 'sessions/{}/analyses'.format(target_collection_id)
+        body = MultipartEncoder([('metadata', json.dumps(metadata))], [])
+        analysis_id = self.request(
+            analysis_endpoint, method='POST',
+            data=body, headers={'Content-Type': body.content_type}).json()['_id']
+        files_endpoint = '{}/{}/files'.format(analysis_endpoint, analysis_id)
+
+        uploads = [
+            (kind, filename, os.path.relpath(filename, dir))
+            for kind, dir in (('input', in_dir), ('output', out_dir))
+            for filename in _find_files(dir)
+        ]
+
+        def _upload(kind, filename, relative):
+            size = os.path.getsize(filename)
+            file_metadata = {kind + 's': [{'name': relative}]}
+            attempt = 0
+            while True:
+                attempt += 1
+                start = time.time()
+                body = MultipartEncoder(
+                    [('metadata', json.dumps(file_metadata))], [('file', relative, filename)])
+                try:
+                    self.request(
+                        files_endpoint, method='POST',
+                        data=body, headers={'Content-Type': body.content_type})
+                    return FileUploadResult(relative, kind, size, time.time() - start, attempt, None)
+                except (requests.exceptions.ConnectionError, st_exceptions.APIException) as e:
+                    status_code = getattr(getattr(e, 'response', None), 'status_code', None)
+                    retryable = status_code is None or status_code == 429 or status_code >= 500
+                    if not retryable or attempt >= max_attempts:
+                        log.warning('Could not upload {}: {}'.format(relative, e))
+                        return FileUploadResult(relative, kind, size, time.time() - start, attempt, e)
+                    log.info('Upload of {} failed ({}), retrying.'.format(relative, e))
+                    if self.retry_policy:
+                        self.retry_policy.wait(attempt)
+                finally:
+                    body.close()
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_upload, *upload) for upload in uploads]
+            results = [future.result() for future in tqdm(futures)]
+
+        if any(result.error for result in results):
+            raise st_exceptions.UploadError(analysis_id, results)
+
+        return analysis_id, results
+
     def submit_job(self, inputs, destination, tags=[]):
         '''Submits a job to the flywheel factory
 
@@ -433,6 +1375,8 @@ class ScitranClient(object):
         os.mkdir(out_dir)
 
         log.info('Running container {} on with input {} and output {}'.format(container, in_dir, out_dir))
+        # docker is only needed for running gears, so it is not imported with the module.
+        import st_docker
         st_docker.run_container(container, command=command, in_dir=in_dir, out_dir=out_dir)
 
         log.info('Uploading results to collection with id {}.'.format(target_collection_id))
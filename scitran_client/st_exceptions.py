@@ -29,6 +29,48 @@ class WrongFormat(APIException):
     pass
 
 
+class CircuitOpen(Exception):
+    '''Raised instead of sending a request to a server that has been failing repeatedly.'''
+    pass
+
+
+class PagingError(Exception):
+    '''Raised when a page of search results starts with the same result as the previous page, which
+    means the server ignored the parameters that select the page.'''
+    pass
+
+
+class DownloadError(Exception):
+    '''Raised after a bulk download when some of the files could not be downloaded.
+
+    Attributes:
+        file_paths (list): Paths of the downloaded files, in input order. Failed files are None.
+        errors (dict): Maps the input index of every failed file to the exception it raised.
+    '''
+    def __init__(self, file_paths, errors):
+        self.file_paths = file_paths
+        self.errors = errors
+        message = '{} of {} files failed to download. First error: {}'.format(
+            len(errors), len(file_paths), errors[min(errors)])
+        super(DownloadError, self).__init__(message)
+
+
+class UploadError(Exception):
+    '''Raised after uploading the files of an analysis one by one when some of them failed.
+
+    Attributes:
+        analysis_id (str): ID of the analysis the files were uploaded to.
+        results (list): FileUploadResult of every file. Failed files have an `error`.
+    '''
+    def __init__(self, analysis_id, results):
+        self.analysis_id = analysis_id
+        self.results = results
+        failed = [r for r in results if r.error]
+        message = '{} of {} files failed to upload to analysis {}. First error: {}'.format(
+            len(failed), len(results), analysis_id, failed[0].error)
+        super(UploadError, self).__init__(message)
+
+
 class DockerException(Exception):
     pass
 
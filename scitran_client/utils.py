@@ -1,9 +1,9 @@
 from __future__ import print_function
 
-import pandas as pd
-import numpy as np
 from copy import deepcopy
 
+# pandas and numpy are imported by the functions that use them, as they are slow to import.
+
 __author__ = 'vsitzmann'
 
 
@@ -70,6 +70,8 @@ def fulltext_df_search(key_value_pairs, dataframe):
         numpy array: A boolean vector that can be used to index into the pandas dataframe.
 
     '''
+    import numpy as np
+
     overall_matches = np.ones(len(dataframe), dtype=bool)
     for key, value in key_value_pairs.iteritems():
         fitting_columns = [column for column in dataframe.columns if key in column]
@@ -99,4 +101,6 @@ def get_search_result_df(search_results):
         # return None when there are no results because json_normalize crashes
         # with empty lists.
         return None
+    import pandas as pd
+
     return pd.io.json.json_normalize(search_results)
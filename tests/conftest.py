@@ -0,0 +1,48 @@
+import json
+import pytest
+import requests_mock
+from benchmarks.fake_flywheel import FakeFlywheel
+from scitran_client import ScitranClient
+
+host = 'https://flywheel.io'
+
+
+@pytest.fixture
+def mock():
+    with requests_mock.mock() as m:
+        yield m
+
+
+@pytest.fixture
+def client(tmpdir, mock):
+    st_dir = tmpdir.mkdir('st')
+    st_dir.join('auth.json').write(json.dumps({'test': dict(url=host, api_key='secret')}))
+    mock.get('{}/api/users/self'.format(host), status_code=200)
+    downloads_dir = tmpdir.mkdir('downloads')
+    return ScitranClient(
+        'test',
+        st_dir=str(st_dir),
+        downloads_dir=str(downloads_dir),
+        gear_in_dir=str(downloads_dir.join('input')),
+        gear_out_dir=str(downloads_dir.join('output')),
+    )
+
+
+@pytest.fixture
+def fake_server():
+    '''A local fake Flywheel server, for tests that send requests from several threads at once, which
+    requests_mock does not support.'''
+    with FakeFlywheel(session_count=1, file_count=0) as server:
+        yield server
+
+
+@pytest.fixture
+def fake_client(tmpdir, fake_server):
+    downloads_dir = tmpdir.mkdir('fake_downloads')
+    return ScitranClient(
+        fake_server.url,
+        st_dir=fake_server.write_auth(str(tmpdir.mkdir('fake_st'))),
+        downloads_dir=str(downloads_dir),
+        gear_in_dir=str(downloads_dir.join('input')),
+        gear_out_dir=str(downloads_dir.join('output')),
+    )
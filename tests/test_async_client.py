@@ -0,0 +1,24 @@
+from scitran_client import AsyncScitranClient
+from scitran_client.st_exceptions import NotFound
+from conftest import host
+
+
+def test_request(client, mock):
+    mock.get('{}/api/projects'.format(host), json=[dict(label='ADHD study')])
+
+    with AsyncScitranClient(client) as async_client:
+        future = async_client.request('projects')
+        assert future.result().json() == [dict(label='ADHD study')]
+
+
+def test_request_error(client, mock):
+    mock.get('{}/api/projects/missing'.format(host), status_code=404)
+
+    with AsyncScitranClient(client) as async_client:
+        assert isinstance(async_client.request('projects/missing').exception(), NotFound)
+
+
+def test_search(fake_client, fake_server):
+    with AsyncScitranClient(fake_client, max_workers=2) as async_client:
+        futures = [async_client.search_sessions({}) for _ in range(4)]
+        assert [len(f.result()) for f in futures] == [fake_server.search_hit_count] * 4
@@ -0,0 +1,19 @@
+from benchmarks.run import run_benchmarks, compare, BENCHMARKS
+
+
+def test_benchmarks_run():
+    results = run_benchmarks(repeat=1, server_kwargs=dict(
+        session_count=3, file_count=3, file_size=1000, search_hit_count=25))
+
+    assert sorted(results) == sorted(name for name, _ in BENCHMARKS)
+    assert results['search']['requests'] == 1
+    assert results['iter_search']['requests'] == 13
+    assert results['download_all']['requests'] == 3
+    assert results['download_archive']['requests'] == 2
+    assert results['download_file']['mb_per_s'] > 0
+
+
+def test_compare():
+    baseline = dict(benchmarks=dict(search=dict(median=1.0), download_file=dict(median=1.0)))
+    current = dict(benchmarks=dict(search=dict(median=1.5), download_file=dict(median=1.05)))
+    assert compare(baseline, current, threshold=.1) == ['search']
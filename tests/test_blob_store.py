@@ -0,0 +1,73 @@
+from scitran_client import BlobStore, ScitranClient
+from conftest import host
+import hashlib
+import os
+import time
+
+
+def _hash(content):
+    return 'v0-sha384-' + hashlib.sha384(content).hexdigest()
+
+
+def test_blob_store_add_and_link(tmpdir):
+    store = BlobStore(str(tmpdir.join('store')), max_bytes=1024)
+    src = tmpdir.join('src.txt')
+    src.write('hello')
+
+    assert not store.link(_hash(b'hello'), str(tmpdir.join('dest.txt')))
+    store.add(_hash(b'hello'), str(src))
+    assert store.link(_hash(b'hello'), str(tmpdir.join('dest.txt')))
+
+    assert tmpdir.join('dest.txt').read() == 'hello'
+    assert os.path.samefile(str(tmpdir.join('dest.txt')), store.path_for(_hash(b'hello')))
+
+
+def test_blob_store_evicts_least_recently_used(tmpdir):
+    store = BlobStore(str(tmpdir.join('store')), max_bytes=10)
+    for content in (b'aaaa', b'bbbb'):
+        tmpdir.join(content).write(content)
+        store.add(_hash(content), str(tmpdir.join(content)))
+    # make sure the access times differ before touching the first blob again.
+    time.sleep(.01)
+    assert store.get(_hash(b'aaaa')) is not None
+
+    tmpdir.join('cccc').write('cccc')
+    store.add(_hash(b'cccc'), str(tmpdir.join('cccc')))
+
+    assert store.get(_hash(b'aaaa')) is not None
+    assert store.get(_hash(b'bbbb')) is None
+    assert store.get(_hash(b'cccc')) is not None
+    assert store.size() == 8
+
+
+def test_blob_store_only_walks_when_over_budget(tmpdir, monkeypatch):
+    store = BlobStore(str(tmpdir.join('store')), max_bytes=10)
+    walks = []
+    blobs = store._blobs
+    monkeypatch.setattr(store, '_blobs', lambda: walks.append(1) or blobs())
+
+    for content in (b'aaaa', b'bbbb', b'aaaa'):
+        tmpdir.join(content).write(content)
+        store.add(_hash(content), str(tmpdir.join(content)))
+    # the first add counts the store, re-adding a blob does not grow it.
+    assert len(walks) == 1
+
+    tmpdir.join('cccc').write('cccc')
+    store.add(_hash(b'cccc'), str(tmpdir.join('cccc')))
+    assert len(walks) == 2
+    assert store.size() == 8
+
+
+def test_download_file_shares_blobs(client, mock, tmpdir):
+    client = ScitranClient(
+        'test', st_dir=client.st_dir, downloads_dir=client.downloads_dir,
+        gear_in_dir=client.gear_in_dir, gear_out_dir=client.gear_out_dir,
+        blob_store=True)
+    mock.get('{}/api/acquisitions/acq/files/a.txt'.format(host), content=b'hello')
+    call_count = mock.call_count
+
+    client.download_file('acquisitions', 'acq', 'a.txt', _hash(b'hello'), dest_dir=str(tmpdir.mkdir('one')))
+    path = client.download_file('acquisitions', 'acq', 'a.txt', _hash(b'hello'), dest_dir=str(tmpdir.mkdir('two')))
+
+    assert open(path).read() == 'hello'
+    assert mock.call_count == call_count + 1
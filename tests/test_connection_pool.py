@@ -0,0 +1,72 @@
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from scitran_client.connection_pool import CountingHTTPAdapter
+import pytest
+import requests
+import threading
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class _ClosingHandler(_KeepAliveHandler):
+    protocol_version = 'HTTP/1.0'
+
+
+def _serve(handler):
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def server():
+    for url in _serve(_KeepAliveHandler):
+        yield url
+
+
+@pytest.fixture
+def closing_server():
+    for url in _serve(_ClosingHandler):
+        yield url
+
+
+def test_counting_adapter(server):
+    adapter = CountingHTTPAdapter(pool_connections=1, pool_maxsize=2)
+    session = requests.Session()
+    session.mount('http://', adapter)
+
+    for _ in range(3):
+        assert session.get(server + '/').text == 'ok'
+
+    assert adapter.counters.as_dict() == dict(requests=3, new_connections=1, reused_connections=2)
+
+
+def test_counting_adapter_closed_connections(closing_server):
+    adapter = CountingHTTPAdapter(pool_connections=1, pool_maxsize=2)
+    session = requests.Session()
+    session.mount('http://', adapter)
+
+    for _ in range(3):
+        assert session.get(closing_server + '/').text == 'ok'
+
+    # the server closes every connection, so every request needs a new one.
+    assert adapter.counters.as_dict() == dict(requests=3, new_connections=3, reused_connections=0)
+
+
+def test_client_pool_configuration(client):
+    assert client.session.adapters['https://']._pool_maxsize == 10
+    assert client.connection_stats() == dict(requests=0, new_connections=0, reused_connections=0)
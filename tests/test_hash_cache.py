@@ -0,0 +1,42 @@
+from scitran_client import HashCache
+from conftest import host
+import hashlib
+
+
+def test_hash_cache(tmpdir):
+    cache = HashCache(str(tmpdir.join('cache', 'hashes.sqlite')))
+    f = tmpdir.join('a.txt')
+    f.write('hello')
+
+    assert cache.get(str(f)) is None
+    cache.put(str(f), 'v0-sha384-abc')
+    assert cache.get(str(f)) == 'v0-sha384-abc'
+
+    f.write('hello, again')
+    assert cache.get(str(f)) is None
+
+
+def test_hash_cache_invalidate(tmpdir):
+    cache = HashCache(str(tmpdir.join('hashes.sqlite')))
+    for name in ('a.txt', 'b.txt'):
+        tmpdir.join(name).write(name)
+        cache.put(str(tmpdir.join(name)), name)
+
+    cache.invalidate(str(tmpdir.join('a.txt')))
+    assert cache.get(str(tmpdir.join('a.txt'))) is None
+    assert cache.get(str(tmpdir.join('b.txt'))) == 'b.txt'
+
+    cache.invalidate()
+    assert cache.get(str(tmpdir.join('b.txt'))) is None
+
+
+def test_download_file_uses_hash_cache(client, mock, tmpdir, monkeypatch):
+    content = b'hello world'
+    file_hash = 'v0-sha384-' + hashlib.sha384(content).hexdigest()
+    mock.get('{}/api/acquisitions/acq/files/a.txt'.format(host), content=content)
+    client.download_file('acquisitions', 'acq', 'a.txt', file_hash, dest_dir=str(tmpdir))
+
+    # the downloaded file is known to the cache, so it is not hashed again.
+    monkeypatch.setattr('scitran_client.st_client.compute_file_hash', None)
+    client.download_file('acquisitions', 'acq', 'a.txt', file_hash, dest_dir=str(tmpdir))
+    assert mock.call_count == 1
@@ -0,0 +1,64 @@
+from scitran_client import HTTPCache
+from conftest import host
+
+
+def test_conditional_get(client, mock):
+    client.http_cache = HTTPCache()
+    body = '{"_id": "123", "analyses": []}'
+    mock.get('{}/api/sessions/123'.format(host), [
+        dict(text=body, headers={'ETag': '"v1"'}),
+        dict(status_code=304),
+    ])
+
+    assert client.request('sessions/123').json() == dict(_id='123', analyses=[])
+    assert 'If-None-Match' not in mock.last_request.headers
+
+    assert client.request('sessions/123').json() == dict(_id='123', analyses=[])
+    assert mock.last_request.headers['If-None-Match'] == '"v1"'
+    assert client.http_cache.stats() == dict(hits=1, misses=1, hit_rate=.5, bytes_saved=len(body))
+
+
+def test_changed_document(client, mock):
+    client.http_cache = HTTPCache()
+    mock.get('{}/api/sessions/123'.format(host), [
+        dict(json=dict(label='old'), headers={'Last-Modified': 'Mon, 01 May 2017 00:00:00 GMT'}),
+        dict(json=dict(label='new'), headers={'Last-Modified': 'Tue, 02 May 2017 00:00:00 GMT'}),
+        dict(status_code=304),
+    ])
+
+    assert client.request('sessions/123').json() == dict(label='old')
+    assert client.request('sessions/123').json() == dict(label='new')
+    assert client.request('sessions/123').json() == dict(label='new')
+    assert mock.last_request.headers['If-Modified-Since'] == 'Tue, 02 May 2017 00:00:00 GMT'
+
+
+def test_max_entries(client, mock):
+    client.http_cache = HTTPCache(max_entries=1)
+    for session in ('1', '2'):
+        mock.get('{}/api/sessions/{}'.format(host, session), json={}, headers={'ETag': session})
+        client.request('sessions/{}'.format(session))
+
+    assert client.http_cache.get(client.http_cache.key(client._url('sessions/1'), None)) is None
+    assert client.http_cache.get(client.http_cache.key(client._url('sessions/2'), None)) is not None
+
+
+def test_key_params():
+    url = host + '/api/projects'
+    assert HTTPCache.key(url, dict(a='1', b='2')) == HTTPCache.key(url, dict(b='2', a='1'))
+    assert HTTPCache.key(url, [('a', '1'), ('a', '2')]) != HTTPCache.key(url, [('a', '2'), ('a', '1')])
+    assert HTTPCache.key(url, 'a=1') != HTTPCache.key(url, None)
+    hash(HTTPCache.key(url, dict(a=['1', '2'])))
+
+
+def test_tickets_are_not_cached(client, mock):
+    client.http_cache = HTTPCache()
+    endpoint = 'sessions/123/analyses/456/files/a.txt'
+    mock.get('{}/api/{}'.format(host, endpoint), [
+        dict(json=dict(ticket='t0'), headers={'ETag': '"v1"'}),
+        dict(json=dict(ticket='t1'), headers={'ETag': '"v1"'}),
+    ])
+
+    assert client.request(endpoint, params=dict(ticket='')).json() == dict(ticket='t0')
+    assert client.request(endpoint, params=dict(ticket='')).json() == dict(ticket='t1')
+    assert 'If-None-Match' not in mock.last_request.headers
+    assert client.http_cache.stats()['misses'] == 0
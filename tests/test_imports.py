@@ -0,0 +1,6 @@
+from benchmarks.import_time import measure_import
+
+
+def test_heavy_modules_are_imported_lazily():
+    seconds, modules = measure_import()
+    assert modules == []
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from scitran_client.json_stream import iter_object_array
+from conftest import host
+import json
+import pytest
+
+
+def _chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64, 100000])
+def test_iter_object_array(chunk_size):
+    doc = dict(
+        before=[1, dict(x='y')],
+        files=[dict(_id=str(i), size=i * 1.5, name=u'bräin {}'.format(i), info=dict(a=[1, None])) for i in range(20)],
+        total=12345,
+    )
+    data = json.dumps(doc, ensure_ascii=False).encode('utf-8')
+
+    assert list(iter_object_array(_chunked(data, chunk_size), 'files')) == doc['files']
+
+
+@pytest.mark.parametrize('data,items', [
+    (b'{}', []),
+    (b'{"files": []}', []),
+    (b' { "a" : 12 , "files" : [ 1 , 2 ] } ', [1, 2]),
+])
+def test_iter_object_array_edge_cases(data, items):
+    assert list(iter_object_array(_chunked(data, 1), 'files')) == items
+
+
+def test_iter_object_array_invalid():
+    with pytest.raises(ValueError):
+        list(iter_object_array([b'{"files": [{"_id": 1}'], 'files'))
+
+
+def test_stream_search(client, mock):
+    mock.post('{}/api/search'.format(host), json=dict(files=[dict(_id='1'), dict(_id='2')]))
+
+    assert list(client.stream_search(dict(path='analyses/files'))) == [dict(_id='1'), dict(_id='2')]
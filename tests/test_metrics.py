@@ -0,0 +1,65 @@
+import json
+import pytest
+from scitran_client import st_exceptions
+from scitran_client import RequestMetrics
+from scitran_client.metrics import endpoint_template
+from conftest import host
+
+
+def test_endpoint_template():
+    assert endpoint_template('sessions/5890a2ba7a3b2c001ca3c4b6/analyses') == 'sessions/{id}/analyses'
+    assert endpoint_template('groups/vistalab/projects') == 'groups/{id}/projects'
+    assert endpoint_template('acquisitions/5890a2ba7a3b2c001ca3c4b6/files/brain.nii.gz?ticket=') == \
+        'acquisitions/{id}/files/{name}'
+    assert endpoint_template('search/files') == 'search/files'
+
+
+def test_percentiles():
+    metrics = RequestMetrics()
+    for _ in range(98):
+        metrics.record('get', 'sessions/123', .01)
+    metrics.record('get', 'sessions/123', 1, error=True)
+    metrics.record('get', 'sessions/123', 5, bytes_in=10, bytes_out=20)
+
+    stats = metrics.as_dict()['GET sessions/{id}']
+    assert stats['requests'] == 100
+    assert stats['errors'] == 1
+    assert (stats['bytes_in'], stats['bytes_out']) == (10, 20)
+    # percentiles are the upper bounds of buckets that are 50% wide.
+    assert .01 <= stats['p50'] < .015
+    assert .01 <= stats['p95'] < .015
+    assert 1 <= stats['p99'] < 1.5
+    assert json.loads(metrics.to_json()).keys() == ['GET sessions/{id}']
+
+
+def test_prometheus():
+    metrics = RequestMetrics()
+    metrics.record('GET', 'sessions/123', .01)
+    metrics.record('GET', 'sessions/123', 100, error=True)
+    lines = metrics.to_prometheus().splitlines()
+
+    labels = 'method="GET",endpoint="sessions/{id}"'
+    assert '# TYPE scitran_client_request_duration_seconds histogram' in lines
+    assert 'scitran_client_request_duration_seconds_bucket{' + labels + ',le="+Inf"} 2' in lines
+    assert 'scitran_client_request_duration_seconds_count{' + labels + '} 2' in lines
+    assert 'scitran_client_request_errors_total{' + labels + '} 1' in lines
+    buckets = [line for line in lines if line.startswith('scitran_client_request_duration_seconds_bucket')]
+    counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+    assert counts == sorted(counts)
+
+
+def test_client_stats(client, mock):
+    mock.get('{}/api/sessions/123'.format(host), text='{"label": "a"}')
+    mock.post('{}/api/sessions/123/analyses'.format(host), status_code=500)
+
+    client.request('sessions/123')
+    with pytest.raises(st_exceptions.BadRequest):
+        client.request('sessions/123/analyses', method='POST', json={'label': 'b'})
+
+    stats = client.stats()
+    assert stats['endpoints']['GET sessions/{id}']['bytes_in'] == len('{"label": "a"}')
+    assert stats['endpoints']['POST sessions/{id}/analyses']['errors'] == 1
+    assert stats['endpoints']['POST sessions/{id}/analyses']['bytes_out'] == len(json.dumps({'label': 'b'}))
+    assert set(stats) == {'endpoints', 'connections', 'retries', 'downloads', 'http_cache', 'search_cache',
+                          'single_flight', 'rate_limiter'}
+    json.dumps(stats)
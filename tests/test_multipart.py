@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from scitran_client.multipart import MultipartEncoder
+from scitran_client.st_exceptions import NoPermission, UploadError
+from requests.packages.urllib3.fields import RequestField
+from requests.packages.urllib3.filepost import encode_multipart_formdata
+from conftest import host
+import json
+import pytest
+
+
+def test_matches_requests_encoding(tmpdir):
+    tmpdir.join('a.txt').write('hello')
+    tmpdir.join('b.nii').write('x' * 100000)
+    progress = []
+
+    body = MultipartEncoder(
+        [('metadata', '{"label": "hi"}')],
+        [('file1', u'a.txt', str(tmpdir.join('a.txt'))), ('file2', u'dir/b\xe9.nii', str(tmpdir.join('b.nii')))],
+        callback=lambda read, total: progress.append(read),
+        boundary='boundary')
+    # These are the fields requests builds for `data={'metadata': ...}, files=[(name, (filename, fh))]`.
+    fields = [
+        RequestField('metadata', '{"label": "hi"}'),
+        RequestField('file1', 'hello', filename=u'a.txt'),
+        RequestField('file2', 'x' * 100000, filename=u'dir/b\xe9.nii'),
+    ]
+    for field in fields:
+        field.make_multipart()
+    expected, content_type = encode_multipart_formdata(fields, boundary='boundary')
+
+    assert len(body) == len(expected)
+    assert b''.join(iter(lambda: body.read(1000), b'')) == expected
+    assert body.content_type == content_type
+    assert progress[-1] == len(expected)
+
+
+def test_upload_analysis(client, mock, tmpdir):
+    in_dir = tmpdir.mkdir('input')
+    in_dir.join('in.txt').write('input')
+    out_dir = tmpdir.mkdir('output')
+    out_dir.join('out.txt').write('output')
+    received = {}
+
+    def respond(request, context):
+        received['content_length'] = request.headers['Content-Length']
+        received['body'] = request.body.read()
+        return dict(_id='analysis')
+    mock.post('{}/api/sessions/123/analyses'.format(host), json=respond)
+
+    response = client.upload_analysis(str(in_dir), str(out_dir), dict(label='test'), '123')
+
+    assert response.json() == dict(_id='analysis')
+    assert int(received['content_length']) == len(received['body'])
+    assert b'filename="in.txt"\r\n\r\ninput\r\n' in received['body']
+    assert b'filename="out.txt"\r\n\r\noutput\r\n' in received['body']
+    metadata = received['body'].split(b'name="metadata"\r\n\r\n')[1].split(b'\r\n')[0]
+    assert json.loads(metadata) == dict(
+        label='test', inputs=[dict(name='in.txt')], outputs=[dict(name='out.txt')])
+
+
+def test_upload_analysis_files(client, mock, tmpdir, monkeypatch):
+    monkeypatch.setattr('scitran_client.retry.time.sleep', lambda seconds: None)
+    in_dir = tmpdir.mkdir('input')
+    in_dir.join('in.txt').write('input')
+    out_dir = tmpdir.mkdir('output')
+    out_dir.join('out.txt').write('output')
+    mock.post('{}/api/sessions/123/analyses'.format(host), json=dict(_id='analysis'))
+    uploaded = []
+    failed = []
+
+    def respond(request, context):
+        body = request.body.read()
+        # the first attempt at uploading out.txt fails.
+        if b'out.txt' in body and not failed:
+            failed.append(body)
+            context.status_code = 502
+            return {}
+        uploaded.append(body)
+        return {}
+    mock.post('{}/api/sessions/123/analyses/analysis/files'.format(host), json=respond)
+
+    # requests_mock is not thread-safe, so files are uploaded one at a time.
+    analysis_id, results = client.upload_analysis_files(
+        str(in_dir), str(out_dir), dict(label='test'), '123', max_workers=1)
+
+    assert analysis_id == 'analysis'
+    assert [(r.name, r.kind, r.size, r.attempts, r.error) for r in results] == [
+        ('in.txt', 'input', 5, 1, None),
+        ('out.txt', 'output', 6, 2, None),
+    ]
+    assert len(uploaded) == 2
+
+
+def test_upload_analysis_files_error(client, mock, tmpdir):
+    in_dir = tmpdir.mkdir('input')
+    in_dir.join('in.txt').write('input')
+    mock.post('{}/api/sessions/123/analyses'.format(host), json=dict(_id='analysis'))
+    mock.post('{}/api/sessions/123/analyses/analysis/files'.format(host), status_code=403)
+
+    with pytest.raises(UploadError) as e:
+        client.upload_analysis_files(str(in_dir), str(tmpdir.mkdir('output')), dict(label='test'), '123')
+
+    assert e.value.analysis_id == 'analysis'
+    assert isinstance(e.value.results[0].error, NoPermission)
+    assert e.value.results[0].attempts == 1
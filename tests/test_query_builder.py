@@ -1,4 +1,4 @@
-from scitran_client import query, Projects, Sessions, Groups
+from scitran_client import query, Projects, Sessions, Groups, Files
 
 
 def test_query():
@@ -14,3 +14,15 @@ def test_query():
             dict(query=dict(match=dict(label='ADHDLab'))),
         ]})),
     )
+
+
+def test_query_source():
+    assert query(Files).source(includes=['name', 'hash'], excludes=['info']).filter(
+        Files.name.match('brain.nii.gz'),
+    ) == dict(
+        path='files',
+        _source=dict(includes=['name', 'hash'], excludes=['info']),
+        files=dict(filtered=dict(filter={'and': [
+            dict(query=dict(match=dict(name='brain.nii.gz'))),
+        ]})),
+    )
@@ -0,0 +1,141 @@
+from scitran_client import RateLimiter, Limit
+from scitran_client.rate_limit import TokenBucket, endpoint_class, SEARCH, METADATA, FILES
+from concurrent.futures import ThreadPoolExecutor
+from conftest import host
+import hashlib
+import os
+import pytest
+import requests
+import threading
+import time
+
+
+def _hash(content):
+    return 'v0-sha384-' + hashlib.sha384(content).hexdigest()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''Replaces time in the rate_limit module with a clock that only advances when slept.'''
+    now = [1000.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+    monkeypatch.setattr('scitran_client.rate_limit.time.time', lambda: now[0])
+    monkeypatch.setattr('scitran_client.rate_limit.time.sleep', sleep)
+    return now
+
+
+@pytest.mark.parametrize('endpoint,name', [
+    ('search', SEARCH),
+    ('search/files', SEARCH),
+    ('sessions/123/analyses', METADATA),
+    ('gears', METADATA),
+    ('acquisitions/123/files/brain.nii.gz', FILES),
+    ('sessions/123/analyses/456/files', FILES),
+    ('download?ticket=abc', FILES),
+])
+def test_endpoint_class(endpoint, name):
+    assert endpoint_class(endpoint) == name
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+    assert [round(bucket.acquire(), 6) for _ in range(4)] == [0, 0, .1, .1]
+
+    # tokens are refilled while idle, up to the burst size.
+    clock[0] += 60
+    assert [round(bucket.acquire(), 6) for _ in range(3)] == [0, 0, .1]
+
+
+def test_max_in_flight():
+    limiter = RateLimiter({METADATA: Limit(max_in_flight=1)})
+    entered = threading.Event()
+    release = threading.Event()
+    inside = []
+    most_inside = []
+
+    def hold():
+        with limiter.limit(METADATA):
+            inside.append(1)
+            most_inside.append(len(inside))
+            entered.set()
+            release.wait()
+            inside.pop()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    entered.wait()
+    waiter = threading.Thread(target=hold)
+    waiter.start()
+    assert limiter.stats()[METADATA]['in_flight'] == 1
+    release.set()
+    holder.join()
+    waiter.join()
+
+    assert max(most_inside) == 1
+    stats = limiter.stats()[METADATA]
+    assert stats['requests'] == 2
+    assert stats['in_flight'] == 0
+
+
+def test_wait_metrics(clock):
+    limiter = RateLimiter({SEARCH: Limit(rate=2, burst=1)})
+    for _ in range(3):
+        with limiter.limit(SEARCH):
+            pass
+    # classes without a limit are not limited.
+    with limiter.limit(FILES):
+        pass
+
+    assert limiter.stats() == {SEARCH: dict(
+        requests=3, waited=2, wait_seconds=1.0, max_wait_seconds=.5, in_flight=0)}
+
+
+def test_client_rate_limiter(client, mock):
+    client.rate_limiter = RateLimiter()
+    mock.get('{}/api/sessions/123'.format(host), json={})
+    mock.post('{}/api/search'.format(host), json=dict(files=[]))
+
+    client.request('sessions/123')
+    client.search_files({})
+
+    stats = client.stats()['rate_limiter']
+    assert stats[METADATA]['requests'] == 1
+    assert stats[SEARCH]['requests'] == 1
+    assert stats[FILES]['requests'] == 0
+
+
+def test_client_limits_concurrent_downloads(fake_client, fake_server, tmpdir, monkeypatch):
+    fake_client.rate_limiter = RateLimiter({FILES: Limit(max_in_flight=2)})
+    for i in range(6):
+        fake_server.add_file('acq', 'file{}.txt'.format(i), b'x' * 10000)
+    transferring = []
+    most_transferring = []
+    lock = threading.Lock()
+    iter_content = requests.Response.iter_content
+
+    def slow_iter_content(response, *args, **kwargs):
+        with lock:
+            transferring.append(1)
+            most_transferring.append(len(transferring))
+        try:
+            for chunk in iter_content(response, *args, **kwargs):
+                time.sleep(.01)
+                yield chunk
+        finally:
+            with lock:
+                transferring.pop()
+    monkeypatch.setattr(requests.Response, 'iter_content', slow_iter_content)
+
+    def download(i):
+        return fake_client.download_file(
+            'acquisitions', 'acq', 'file{}.txt'.format(i), _hash(b'x' * 10000),
+            dest_dir=str(tmpdir.mkdir('download{}'.format(i))), tqdm_disable=True)
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        paths = list(executor.map(download, range(6)))
+
+    assert all(os.path.getsize(path) == 10000 for path in paths)
+    assert max(most_transferring) == 2
+    assert fake_client.rate_limiter.stats()[FILES]['in_flight'] == 0
@@ -0,0 +1,77 @@
+from scitran_client import RetryPolicy, CircuitBreaker
+from scitran_client.st_exceptions import APIException, CircuitOpen
+from conftest import host
+import pytest
+import requests
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('scitran_client.retry.time.sleep', sleeps.append)
+    return sleeps
+
+
+def test_retries_idempotent_requests(client, mock, sleeps):
+    mock.get('{}/api/projects'.format(host), [
+        dict(status_code=503),
+        dict(exc=requests.exceptions.ConnectionError),
+        dict(json=[], status_code=200),
+    ])
+
+    assert client.request('projects').json() == []
+    assert len(sleeps) == 2
+    assert client.retry_stats()['retries'] == 2
+
+
+def test_does_not_retry_post(client, mock, sleeps):
+    mock.post('{}/api/search'.format(host), status_code=503)
+
+    with pytest.raises(APIException):
+        client.request('search', method='POST')
+    assert sleeps == []
+
+
+def test_gives_up_after_max_retries(client, mock, sleeps):
+    client.retry_policy = RetryPolicy(max_retries=2)
+    mock.get('{}/api/projects'.format(host), status_code=502)
+
+    with pytest.raises(APIException):
+        client.request('projects')
+    assert len(sleeps) == 2
+    assert client.retry_stats()['exhausted'] == 1
+
+
+def test_retry_after(client, mock, sleeps):
+    mock.get('{}/api/projects'.format(host), [
+        dict(status_code=429, headers={'Retry-After': '7'}),
+        dict(json=[], status_code=200),
+    ])
+
+    client.request('projects')
+    assert sleeps == [7]
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+    for retry in range(1, 10):
+        assert 0 <= policy.backoff(retry) <= min(5, 2 ** (retry - 1))
+
+
+def test_circuit_breaker(client, mock, sleeps, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    client.retry_policy = RetryPolicy(max_retries=5, circuit_breaker=breaker)
+    mock.get('{}/api/projects'.format(host), status_code=503)
+
+    with pytest.raises(CircuitOpen):
+        client.request('projects')
+    assert len(sleeps) == 2
+    with pytest.raises(CircuitOpen):
+        client.request('projects')
+
+    # once the reset timeout has passed, a trial request closes the circuit when it succeeds.
+    now = breaker._opened_at
+    monkeypatch.setattr('scitran_client.retry.time.time', lambda: now + 31)
+    mock.get('{}/api/projects'.format(host), json=[])
+    assert client.request('projects').json() == []
+    assert not breaker.is_open
@@ -0,0 +1,51 @@
+from scitran_client import SearchCache, query, Sessions, Projects, Groups
+from scitran_client.search_cache import canonical_search_key
+from conftest import host
+import time
+
+
+def test_canonical_search_key():
+    a = query(Sessions).filter(Projects.label.match('ADHD'), Groups.label.match('lab'))
+    b = query(Sessions).filter(Groups.label.match('lab'), Projects.label.match('ADHD'))
+    assert canonical_search_key(a, host) == canonical_search_key(b, host)
+    assert canonical_search_key(a, host) != canonical_search_key(a, 'https://other.io')
+
+
+def test_search_cache_ttl(tmpdir, monkeypatch):
+    cache = SearchCache(str(tmpdir), ttl=60)
+    cache.put('key', [dict(_id='1')])
+
+    assert cache.get('key') == [dict(_id='1')]
+    assert cache.get('missing') is None
+
+    now = time.time()
+    monkeypatch.setattr('scitran_client.search_cache.time.time', lambda: now + 61)
+    assert cache.get('key') is None
+    assert cache.stats() == dict(hits=1, misses=2)
+    assert tmpdir.listdir() == []
+
+
+def test_search_cache_put_prunes_expired(tmpdir):
+    cache = SearchCache(str(tmpdir), ttl=60)
+    cache.put('old', [])
+    cache.put('older', [])
+    for path in tmpdir.listdir():
+        path.setmtime(time.time() - 61)
+
+    SearchCache(str(tmpdir), ttl=60).put('new', [])
+
+    assert [path.basename for path in tmpdir.listdir()] == ['new.json.gz']
+
+
+def test_search_uses_cache(client, mock, tmpdir):
+    client.search_cache = SearchCache(str(tmpdir))
+    mock.post('{}/api/search'.format(host), json=dict(sessions=[dict(_id='1')]))
+    call_count = mock.call_count
+
+    assert client.search(query(Sessions).filter(Projects.label.match('ADHD'))) == [dict(_id='1')]
+    assert client.search(query(Sessions).filter(Projects.label.match('ADHD'))) == [dict(_id='1')]
+    assert mock.call_count == call_count + 1
+
+    client.search(query(Sessions).filter(Projects.label.match('ADHD')), use_cache=False)
+    assert mock.call_count == call_count + 2
+    assert client.search_cache.stats() == dict(hits=1, misses=1)
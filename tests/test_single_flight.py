@@ -0,0 +1,97 @@
+from scitran_client import SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+from conftest import host
+import pytest
+import threading
+
+
+def test_collapses_concurrent_calls():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait()
+        return 'result'
+
+    leader = threading.Thread(target=single_flight.do, args=('key', slow))
+    leader.start()
+    while not calls:
+        pass
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(single_flight.do, 'key', slow) for _ in range(3)]
+        while single_flight.collapsed < 3:
+            pass
+        release.set()
+        assert [f.result() for f in futures] == ['result'] * 3
+    leader.join()
+
+    assert len(calls) == 1
+    assert single_flight.stats() == dict(calls=1, collapsed=3)
+    # the call is made again once the previous one finished.
+    assert single_flight.do('key', lambda: 'new') == 'new'
+
+
+def test_shares_errors():
+    single_flight = SingleFlight()
+    with pytest.raises(ValueError):
+        single_flight.do('key', lambda: int('x'))
+    assert single_flight.do('key', lambda: 1) == 1
+
+
+def test_client_collapses_identical_gets(client, mock):
+    received = threading.Event()
+    release = threading.Event()
+
+    def respond(request, context):
+        received.set()
+        release.wait()
+        return '{"label": "session"}'
+
+    mock.get('{}/api/sessions/123'.format(host), text=respond)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(lambda: client.request('sessions/123').json())]
+        received.wait()
+        futures += [executor.submit(lambda: client.request('sessions/123').json()) for _ in range(3)]
+        while client.single_flight.collapsed < 3:
+            pass
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert results == [dict(label='session')] * 4
+    # every caller decodes the body itself, so documents can be changed without affecting the others.
+    assert len(set(id(result) for result in results)) == 4
+    assert mock.call_count == 1
+    assert client.stats()['single_flight'] == dict(calls=1, collapsed=3)
+
+
+def test_client_does_not_share_tickets(client):
+    calls = []
+    all_arrived = threading.Event()
+
+    # requests_mock is not thread-safe, so the requests are answered without it.
+    def send_request(url, *args):
+        calls.append(url)
+        if len(calls) == 3:
+            all_arrived.set()
+        all_arrived.wait(5)
+        return 't{}'.format(len(calls))
+    client._send_request = send_request
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(client.request, 'sessions/123/analyses/456/files/a.txt', params=dict(ticket=''))
+            for _ in range(3)
+        ]
+        [f.result() for f in futures]
+
+    assert len(calls) == 3
+    assert client.single_flight.stats() == dict(calls=0, collapsed=0)
+
+
+def test_client_accepts_list_params(client, mock):
+    mock.get('{}/api/projects'.format(host), json=[])
+    assert client.request('projects', params=[('a', '1'), ('a', '2')]).json() == []
+    assert mock.last_request.qs == dict(a=['1', '2'])
@@ -1,5 +1,8 @@
+import json
+import os
+import pytest
 import requests_mock
-from scitran_client.st_auth import _is_valid_token
+from scitran_client.st_auth import _is_valid_token, create_token
 
 host = 'https://flywheel.io'
 
@@ -14,3 +17,25 @@ def test_is_valid_token(mock):
 def test_is_valid_token_invalid(mock):
     mock.get('{}/api/users/self'.format(host), status_code=401)
     assert not _is_valid_token(host, 'yep')
+
+
+@pytest.fixture
+def config_dir(tmpdir):
+    tmpdir.join('auth.json').write(json.dumps({'test': dict(url=host, api_key='secret')}))
+    return str(tmpdir)
+
+
+def test_create_token_caches_validation(config_dir, mock):
+    mock.get('{}/api/users/self'.format(host), status_code=200)
+    assert create_token('test', config_dir) == ('secret', host)
+    assert create_token('test', config_dir) == ('secret', host)
+    assert mock.call_count == 1
+    assert 'secret' not in open(os.path.join(config_dir, 'token_cache.json')).read()
+
+    create_token('test', config_dir, ttl=0)
+    assert mock.call_count == 2
+
+
+def test_create_token_without_validation(config_dir, mock):
+    assert create_token('test', config_dir, validate=False) == ('secret', host)
+    assert mock.call_count == 0
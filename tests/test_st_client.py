@@ -1,8 +1,340 @@
-from scitran_client import compute_file_hash
+from scitran_client import compute_file_hash, FILE_DOWNLOAD_FIELDS
+from scitran_client.st_client import _adaptive_chunk_size
+from scitran_client.st_exceptions import APIException, DownloadError, NotFound, PagingError
+from conftest import host
+import hashlib
+import io
 import os
+import pytest
+import tarfile
+
+
+def _hash(content):
+    return 'v0-sha384-' + hashlib.sha384(content).hexdigest()
 
 
 def test_compute_file_hash():
     assert compute_file_hash(
         os.path.join(os.path.dirname(__file__), 'fixtures/test.csv')
     ) == 'v0-sha384-301d915f78736ff43dd396b5607cade4dffc0cd31c94bb2b80aff005cac042d8826a0a766c5dc2884a942cf960177378'
+
+
+def _file_result(name, content, acquisition_id='acq'):
+    return {'_source': dict(
+        container_name='acquisitions',
+        acquisition={'_id': acquisition_id},
+        name=name,
+        hash=_hash(content),
+        size=len(content),
+    )}
+
+
+def _request_count(client):
+    return sum(stats['requests'] for stats in client.metrics.as_dict().values())
+
+
+def test_download_all_file_search_results(fake_client, fake_server, tmpdir):
+    results = [_file_result('file{}.txt'.format(i), b'content {}'.format(i)) for i in range(5)]
+    for i in range(5):
+        fake_server.add_file('acq', 'file{}.txt'.format(i), b'content {}'.format(i))
+
+    file_paths = fake_client.download_all_file_search_results(results, dest_dir=str(tmpdir), max_workers=3)
+
+    assert file_paths == [str(tmpdir.join('file{}.txt'.format(i))) for i in range(5)]
+    assert tmpdir.join('file3.txt').read() == 'content 3'
+
+
+def test_download_all_file_search_results_collects_errors(fake_client, fake_server, tmpdir):
+    results = [_file_result('good.txt', b'good'), _file_result('bad.txt', b'bad')]
+    fake_server.add_file('acq', 'good.txt', b'good')
+
+    with pytest.raises(DownloadError) as e:
+        fake_client.download_all_file_search_results(results, dest_dir=str(tmpdir), max_workers=2)
+
+    assert e.value.file_paths == [str(tmpdir.join('good.txt')), None]
+    assert list(e.value.errors) == [1]
+    assert isinstance(e.value.errors[1], NotFound)
+
+
+def test_download_all_file_search_results_rejects_colliding_names(fake_client, fake_server, tmpdir):
+    results = [
+        _file_result('dwi.bval', b'first', acquisition_id='acq1'),
+        _file_result('dwi.bval', b'second', acquisition_id='acq2'),
+        _file_result('good.txt', b'good'),
+    ]
+    fake_server.add_file('acq', 'good.txt', b'good')
+
+    with pytest.raises(DownloadError) as e:
+        fake_client.download_all_file_search_results(results, dest_dir=str(tmpdir), max_workers=3)
+
+    assert e.value.file_paths == [None, None, str(tmpdir.join('good.txt'))]
+    assert sorted(e.value.errors) == [0, 1]
+    assert _request_count(fake_client) == 1
+    assert not tmpdir.join('dwi.bval').check()
+
+
+def test_download_all_file_search_results_deduplicates(fake_client, fake_server, tmpdir):
+    results = [
+        _file_result('a.txt', b'shared', acquisition_id='acq1'),
+        _file_result('b.txt', b'shared', acquisition_id='acq2'),
+        _file_result('a.txt', b'shared', acquisition_id='acq3'),
+        _file_result('c.txt', b'other', acquisition_id='acq1'),
+    ]
+    fake_server.add_file('acq1', 'a.txt', b'shared')
+    fake_server.add_file('acq1', 'c.txt', b'other')
+
+    file_paths = fake_client.download_all_file_search_results(results, dest_dir=str(tmpdir), max_workers=2)
+
+    assert file_paths == [str(tmpdir.join(name)) for name in ('a.txt', 'b.txt', 'a.txt', 'c.txt')]
+    assert _request_count(fake_client) == 2
+    assert tmpdir.join('b.txt').read() == 'shared'
+    assert os.path.samefile(str(tmpdir.join('a.txt')), str(tmpdir.join('b.txt')))
+    # the second a.txt already is the downloaded file, so only b.txt saved a transfer.
+    assert fake_client.download_stats() == dict(deduplicated_files=1, deduplicated_bytes=6)
+    assert fake_client.stats()['downloads'] == fake_client.download_stats()
+
+
+def test_download_all_file_search_results_deduplicates_with_colliding_names(client, mock, tmpdir):
+    results = [
+        _file_result('a.txt', b'X', acquisition_id='acq1'),
+        _file_result('b.txt', b'X', acquisition_id='acq2'),
+        _file_result('a.txt', b'Y', acquisition_id='acq3'),
+    ]
+    mock.get('{}/api/acquisitions/acq2/files/b.txt'.format(host), content=b'X')
+
+    with pytest.raises(DownloadError) as e:
+        client.download_all_file_search_results(results, dest_dir=str(tmpdir))
+
+    assert e.value.file_paths == [None, str(tmpdir.join('b.txt')), None]
+    assert sorted(e.value.errors) == [0, 2]
+    assert tmpdir.join('b.txt').read() == 'X'
+    assert client.download_stats()['deduplicated_files'] == 0
+
+
+def test_download_all_file_search_results_verifies_before_linking(client, tmpdir):
+    results = [_file_result('a.txt', b'X', 'acq1'), _file_result('b.txt', b'X', 'acq2')]
+
+    def download_file(container_type, container_id, file_name, file_hash, dest_dir, **kwargs):
+        # stands in for a download that was overwritten after it was verified.
+        tmpdir.join(file_name).write('changed')
+        return str(tmpdir.join(file_name))
+    client.download_file = download_file
+
+    with pytest.raises(DownloadError) as e:
+        client.download_all_file_search_results(results, dest_dir=str(tmpdir))
+
+    assert list(e.value.errors) == [1]
+    assert not tmpdir.join('b.txt').check()
+
+
+def test_download_all_file_search_results_deduplicated_errors(client, mock, tmpdir):
+    results = [_file_result('a.txt', b'shared', 'acq1'), _file_result('b.txt', b'shared', 'acq2')]
+    mock.get('{}/api/acquisitions/acq1/files/a.txt'.format(host), status_code=404)
+
+    with pytest.raises(DownloadError) as e:
+        client.download_all_file_search_results(results, dest_dir=str(tmpdir))
+
+    assert e.value.file_paths == [None, None]
+    assert sorted(e.value.errors) == [0, 1]
+    assert client.download_stats()['deduplicated_files'] == 0
+
+
+def test_download_file_resumes_part_file(client, mock, tmpdir):
+    tmpdir.join('a.txt.part').write('hello ')
+
+    def respond(request, context):
+        assert request.headers['Range'] == 'bytes=6-'
+        context.status_code = 206
+        context.headers['Content-Range'] = 'bytes 6-10/11'
+        return b'world'
+    mock.get('{}/api/acquisitions/acq/files/a.txt'.format(host), content=respond)
+
+    path = client.download_file('acquisitions', 'acq', 'a.txt', _hash(b'hello world'), dest_dir=str(tmpdir))
+
+    assert open(path).read() == 'hello world'
+    assert not tmpdir.join('a.txt.part').exists()
+
+
+def test_download_file_restarts_stale_part_file(client, mock, tmpdir):
+    tmpdir.join('a.txt.part').write('HELL')
+    content = b'hello world'
+
+    def respond(request, context):
+        start = int(request.headers['Range'][len('bytes='):-1]) if 'Range' in request.headers else 0
+        if start:
+            context.status_code = 206
+            context.headers['Content-Range'] = 'bytes {}-10/11'.format(start)
+        return content[start:]
+    mock.get('{}/api/acquisitions/acq/files/a.txt'.format(host), content=respond)
+
+    path = client.download_file('acquisitions', 'acq', 'a.txt', _hash(content), dest_dir=str(tmpdir))
+
+    assert open(path).read() == 'hello world'
+    assert [request.headers.get('Range') for request in mock.request_history] == ['bytes=4-', None]
+
+
+def test_download_file_range_ignored(client, mock, tmpdir):
+    tmpdir.join('a.txt.part').write('stale')
+    mock.get('{}/api/acquisitions/acq/files/a.txt'.format(host), content=b'hello world')
+
+    path = client.download_file('acquisitions', 'acq', 'a.txt', _hash(b'hello world'), dest_dir=str(tmpdir))
+
+    assert open(path).read() == 'hello world'
+
+
+def test_download_file_wrong_hash(client, mock, tmpdir):
+    mock.get('{}/api/acquisitions/acq/files/a.txt'.format(host), content=b'hello world')
+
+    with pytest.raises(Exception) as e:
+        client.download_file('acquisitions', 'acq', 'a.txt', _hash(b'something else'), dest_dir=str(tmpdir))
+
+    assert 'incorrect hash' in str(e.value)
+    assert not tmpdir.join('a.txt').exists()
+    assert not tmpdir.join('a.txt.part').exists()
+
+
+def test_download_file_does_not_reread_download(client, mock, tmpdir, monkeypatch):
+    mock.get('{}/api/acquisitions/acq/files/a.txt'.format(host), content=b'hello world')
+    monkeypatch.setattr('scitran_client.st_client.compute_file_hash', None)
+
+    path = client.download_file('acquisitions', 'acq', 'a.txt', _hash(b'hello world'), dest_dir=str(tmpdir))
+
+    assert open(path).read() == 'hello world'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096, 1024 * 1024])
+def test_compute_file_hash_chunk_size(chunk_size):
+    assert compute_file_hash(
+        os.path.join(os.path.dirname(__file__), 'fixtures/test.csv'), chunk_size=chunk_size
+    ) == 'v0-sha384-301d915f78736ff43dd396b5607cade4dffc0cd31c94bb2b80aff005cac042d8826a0a766c5dc2884a942cf960177378'
+
+
+@pytest.mark.parametrize('content_length,chunk_size', [
+    (None, 64 * 1024),
+    (1024, 64 * 1024),
+    (256 * 1024 * 1024, 1024 * 1024),
+    (100 * 1024 * 1024 * 1024, 4 * 1024 * 1024),
+])
+def test_adaptive_chunk_size(content_length, chunk_size):
+    assert _adaptive_chunk_size(content_length) == chunk_size
+
+
+def test_iter_search(client, mock):
+    pages = [
+        dict(files=[dict(_id='1', sort=[1]), dict(_id='2', sort=[2])]),
+        dict(files=[dict(_id='3', sort=[3]), dict(_id='4', sort=[4])]),
+        dict(files=[dict(_id='5', sort=[5])]),
+    ]
+    mock.post('{}/api/search'.format(host), [dict(json=page) for page in pages])
+
+    results = client.iter_search(dict(path='files'), page_size=2, search_after=True)
+
+    assert next(results)['_id'] == '1'
+    assert mock.call_count == 1
+    assert [r['_id'] for r in results] == ['2', '3', '4', '5']
+    bodies = [r.json() for r in mock.request_history]
+    assert [b.get('search_after') for b in bodies] == [None, [2], [4]]
+    assert not any('from' in b for b in bodies)
+    assert all(b['size'] == 2 and b['path'] == 'files' for b in bodies)
+
+
+def test_iter_search_offsets(client, mock):
+    pages = [dict(sessions=[dict(_id='1', sort=[1]), dict(_id='2', sort=[2])]), dict(sessions=[])]
+    mock.post('{}/api/search'.format(host), [dict(json=page) for page in pages])
+
+    assert [r['_id'] for r in client.iter_search(dict(path='sessions'), page_size=2)] == ['1', '2']
+    assert mock.request_history[-1].json()['from'] == 2
+    assert 'search_after' not in mock.request_history[-1].json()
+
+
+def test_iter_search_repeated_page(client, mock):
+    # a server that ignores the paging parameters returns the first page again.
+    mock.post('{}/api/search'.format(host), json=dict(sessions=[dict(_id='1', sort=[1]), dict(_id='2', sort=[2])]))
+
+    results = client.iter_search(dict(path='sessions'), page_size=2, search_after=True)
+
+    assert [next(results)['_id'] for _ in range(2)] == ['1', '2']
+    with pytest.raises(PagingError):
+        next(results)
+
+
+def test_search_fields(client, mock):
+    mock.post('{}/api/search'.format(host), json=dict(files=[]))
+
+    client.search_files({}, fields=FILE_DOWNLOAD_FIELDS)
+
+    assert mock.last_request.json()['_source'] == FILE_DOWNLOAD_FIELDS
+
+
+def test_token_is_validated_on_first_401(client, mock, monkeypatch):
+    mock.get('{}/api/sessions/123'.format(host), [dict(status_code=401), dict(json={}), dict(status_code=401)])
+    mock.get('{}/api/users/self'.format(host), [dict(status_code=401), dict(status_code=200)])
+    monkeypatch.setattr('scitran_client.st_auth.getpass', lambda prompt: 'new-secret')
+
+    assert client.request('sessions/123').json() == {}
+    assert client.token == 'new-secret'
+    assert mock.last_request.headers['Authorization'] == 'scitran-user new-secret'
+
+    # the key was just validated, so later 401s are errors.
+    with pytest.raises(APIException):
+        client.request('sessions/123')
+
+
+def _tar(members):
+    '''Returns a tar archive with (name, content) members.'''
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as archive:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+def test_download_archive(client, mock, tmpdir):
+    results = [_file_result('file{}.txt'.format(i), b'content {}'.format(i)) for i in range(3)]
+    tmpdir.join('file0.txt').write(b'content 0')
+    mock.post('{}/api/download'.format(host), json=dict(ticket='abc'))
+    mock.get('{}/api/download?ticket=abc'.format(host), content=_tar([
+        ('../../escape.txt', b'content 1'),
+        ('acquisitions/acq/file1.txt', b'content 1'),
+        ('acquisitions/acq/file2.txt', b'content 2'),
+    ]))
+
+    file_paths = client.download_archive(results, dest_dir=str(tmpdir), tqdm_disable=True)
+
+    assert file_paths == [str(tmpdir.join('file{}.txt'.format(i))) for i in range(3)]
+    assert tmpdir.join('file2.txt').read() == 'content 2'
+    # the local copy is not requested again.
+    assert mock.request_history[0].json() == dict(files=[
+        dict(container_name='acquisitions', container_id='acq', filename='file{}.txt'.format(i)) for i in (1, 2)])
+    assert not os.path.exists(str(tmpdir.join('../../escape.txt')))
+    assert not tmpdir.join('file1.txt.part').exists()
+
+
+def test_download_archive_errors(client, mock, tmpdir):
+    results = [_file_result('file{}.txt'.format(i), b'content {}'.format(i)) for i in range(3)]
+    mock.post('{}/api/download'.format(host), json=dict(ticket='abc'))
+    mock.get('{}/api/download?ticket=abc'.format(host), content=_tar([
+        ('acquisitions/acq/file0.txt', b'content 0'),
+        ('acquisitions/acq/file1.txt', b'corrupt'),
+    ]))
+
+    with pytest.raises(DownloadError) as e:
+        client.download_archive(results, dest_dir=str(tmpdir), tqdm_disable=True)
+
+    assert e.value.file_paths == [str(tmpdir.join('file0.txt')), None, None]
+    assert 'incorrect hash' in str(e.value.errors[1])
+    assert 'missing' in str(e.value.errors[2])
+    assert not tmpdir.join('file1.txt').exists()
+    assert not tmpdir.join('file1.txt.part').exists()
+
+
+def test_download_archive_rejects_colliding_names(client, mock, tmpdir):
+    results = [_file_result('dwi.bval', b'first', 'acq1'), _file_result('dwi.bval', b'second', 'acq2')]
+
+    with pytest.raises(DownloadError) as e:
+        client.download_archive(results, dest_dir=str(tmpdir), tqdm_disable=True)
+
+    assert sorted(e.value.errors) == [0, 1]
+    assert mock.call_count == 0
@@ -0,0 +1,51 @@
+from benchmarks.fake_flywheel import FakeFlywheel
+from concurrent.futures import ThreadPoolExecutor
+from scitran_client import ScitranClient
+import os
+import threading
+import pytest
+
+
+@pytest.fixture
+def server():
+    with FakeFlywheel(session_count=20, file_count=20, file_size=10000) as server:
+        yield server
+
+
+def test_concurrent_requests(server, tmpdir):
+    client = ScitranClient(
+        server.url, st_dir=server.write_auth(str(tmpdir)), downloads_dir=str(tmpdir),
+        gear_in_dir=str(tmpdir.join('input')), gear_out_dir=str(tmpdir.join('output')),
+        pool_maxsize=50)
+    files = server.file_search_results()
+    sessions_used = {}
+
+    def work(i):
+        sessions_used[threading.current_thread().ident] = id(client.session)
+        kind = i % 4
+        if kind == 0:
+            session = server.sessions[i % len(server.sessions)]
+            assert client.request('sessions/{}'.format(session['_id'])).json()['label'] == session['label']
+        elif kind == 1:
+            assert len(client.search(dict(path='acquisitions'), num_results=10, use_cache=False)) == 10
+        elif kind == 2:
+            source = files[i % len(files)]['_source']
+            dest_dir = str(tmpdir.mkdir('download{}'.format(i)))
+            path = client.download_file(
+                'acquisitions', source['acquisition']['_id'], source['name'], source['hash'],
+                dest_dir=dest_dir, tqdm_disable=True)
+            assert os.path.getsize(path) == source['size']
+        else:
+            session = server.sessions[i % len(server.sessions)]
+            assert client.request('sessions/{}/acquisitions'.format(session['_id'])).json()
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        list(executor.map(work, range(400)))
+
+    stats = client.stats()
+    assert not any(endpoint['errors'] for endpoint in stats['endpoints'].values())
+    sent = sum(endpoint['requests'] for endpoint in stats['endpoints'].values())
+    assert sent + stats['single_flight']['collapsed'] == 400
+    assert stats['connections']['requests'] == sent
+    # every thread used a session of its own.
+    assert len(set(sessions_used.values())) == len(sessions_used) > 1